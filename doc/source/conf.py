@@ -18,6 +18,7 @@ import sys, os
 # add these directories to sys.path here. If the directory is relative to the
 # documentation root, use os.path.abspath to make it absolute, like shown here.
 # sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.abspath("../tools"))
 
 # -- General configuration -----------------------------------------------------
 
@@ -33,8 +34,15 @@ extensions = [
     "sphinxcontrib.matlab",
     "sphinx.ext.extlinks",
     "sphinxcontrib.bibtex",
+    "highlight_cache",
+    "listing_linker",
+    "bibtex_cache",
 ]
 
+# profile the build (see tools/build_profiler.py) if COSMO_DOC_PROFILE is set
+if os.getenv("COSMO_DOC_PROFILE"):
+    extensions.append("build_profiler")
+
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ["_templates"]
 
@@ -103,9 +111,10 @@ from pybtex.style.formatting.alpha import Style as AlphaStyle
 from pybtex.plugin import register_plugin
 from pybtex.richtext import Tag, Text, Symbol
 from pybtex.style.names.lastfirst import NameStyle as AuthorNameStyle
+from bibtex_cache import CachedFormatMixin
 
 
-class CoSMoRefStyle(AlphaStyle):
+class CoSMoRefStyle(CachedFormatMixin, AlphaStyle):
     def format_article(self, e):
         text = super(CoSMoRefStyle, self).format_article(e)
 
@@ -0,0 +1,140 @@
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# caches bibliography entries formatted by pybtex between Sphinx builds
+#
+# Formatting styles that inherit from CachedFormatMixin (such as
+# CoSMoRefStyle in conf.py) store each formatted entry, keyed by the label
+# and the hash of the fields and persons of the bibtex entry, together with
+# the version of the style (the hash of the source code of the style
+# classes, or of the code of their methods if the source is not available)
+# and of pybtex. Citations of unchanged entries are then not formatted
+# again.
+#
+# As a Sphinx extension, this module loads the cache from the doctrees
+# directory when the build starts and stores it there when the build is
+# finished. Without the extension, styles format entries as usual.
+
+import os
+import pickle
+import hashlib
+import inspect
+
+import pybtex
+
+from highlight_cache import PersistentCache
+
+cache_name = "bibtex_cache.pickle"
+
+# the cache in use during a build, or None
+cache = None
+
+# mapping from style class to version
+style_versions = dict()
+
+
+def entry_hash(entry):
+    """hash of the type, fields and persons of a pybtex Entry"""
+    fields = sorted((name, str(value)) for name, value in entry.fields.items())
+    persons = sorted(
+        (role, [str(person) for person in persons])
+        for role, persons in entry.persons.items()
+    )
+    data = repr((entry.type, fields, persons)).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def code_fingerprint(code):
+    """bytecode, constants and names of a code object, including those of
+    nested code objects; independent of PYTHONHASHSEED"""
+    consts = []
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            consts.append(code_fingerprint(const))
+        elif isinstance(const, frozenset):
+            consts.append(repr(sorted(const, key=repr)))
+        else:
+            consts.append(repr(const))
+
+    return repr((code.co_code, consts, code.co_names))
+
+
+def class_fingerprint(cls):
+    """names and code of the attributes defined in a class"""
+    parts = []
+    for name, value in sorted(vars(cls).items()):
+        if isinstance(value, property):
+            funcs = [value.fget, value.fset, value.fdel]
+        else:
+            # unwrap static and class methods
+            funcs = [getattr(value, "__func__", value)]
+
+        codes = [f.__code__ for f in funcs if hasattr(f, "__code__")]
+        if codes:
+            parts.append((name, [code_fingerprint(c) for c in codes]))
+        elif isinstance(value, (str, int, float, bool, tuple, type(None))):
+            parts.append((name, repr(value)))
+        else:
+            parts.append((name, type(value).__name__))
+
+    return repr(parts)
+
+
+def style_version(style_class):
+    """hash of the source code of a style class and its base classes
+    (except those of pybtex, which are covered by the pybtex version)"""
+    if style_class in style_versions:
+        return style_versions[style_class]
+
+    h = hashlib.sha1(pybtex.__version__.encode("utf-8"))
+    for cls in style_class.__mro__:
+        if cls.__module__.startswith("pybtex") or cls is object:
+            continue
+        try:
+            h.update(inspect.getsource(cls).encode("utf-8"))
+        except (OSError, TypeError):
+            # source not available, e.g. for classes defined in conf.py
+            # by exec; use the code of the methods instead
+            h.update(class_fingerprint(cls).encode("utf-8"))
+
+    style_versions[style_class] = h.hexdigest()
+    return style_versions[style_class]
+
+
+class CachedFormatMixin(object):
+    """mixin for pybtex formatting styles that caches format_entry"""
+
+    def format_entry(self, label, entry, bib_data=None):
+        parent = super(CachedFormatMixin, self)
+        compute = lambda: parent.format_entry(label, entry, bib_data=bib_data)
+        if cache is None:
+            return compute()
+
+        key = (style_version(type(self)), label, entry_hash(entry))
+        return cache.get(key, compute)
+
+
+def load(app):
+    global cache
+    fn = os.path.join(app.doctreedir, cache_name)
+    cache = PersistentCache(fn, pybtex.__version__)
+
+
+def save(app, exception):
+    # the cache stays loaded, for further builds by the same application
+    # (as in watch_docs.py)
+    if cache is None or exception is not None:
+        return
+
+    try:
+        cache.save()
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # formatted entries that cannot be pickled are not cached
+        os.remove(cache.fn + ".tmp")
+
+
+def setup(app):
+    app.connect("builder-inited", load)
+    app.connect("build-finished", save)
+    return dict(version="1.0", parallel_read_safe=True, parallel_write_safe=True)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# builds a zip archive with exercise files for each workshop
+#
+# For each workshop with an exercises page (source/<workshop>_ex_toc.rst),
+# the skeleton files referred to (as :ref:`<name>_skl`) in the exercises
+# in its toctree are collected. The archive
+# source/_static/bundles/<workshop>_exercises.zip contains, for each of
+# these, skeleton/<name>.m (with the code between '% >@@>' and '% <@@<'
+# replaced, as in the _skl pages made by matlab2rst.py) and
+# solution/<name>.m (the full file without these markers).
+#
+# Archives are written member by member, with fixed timestamps and
+# permissions, so that an archive with the same members is identical
+# byte-by-byte. The hashes of the members of each archive are stored in
+# .bundles.json, and an archive is only written if these changed.
+#
+# Usage:
+#   build_bundles.py
+
+import os
+import re
+import glob
+import json
+import zipfile
+import hashlib
+import argparse
+from os.path import join, isfile, basename
+
+from matlab2rst import get_all_fns, MatlabFile, output_root_abs, base_name
+from matlab2rst import write_if_changed
+
+bundles_rel = "_static/bundles"
+manifest_name = ".bundles.json"
+ex_toc_postfix = "_ex_toc.rst"
+
+# timestamp of all members (the earliest that zip supports)
+member_date_time = (1980, 1, 1, 0, 0, 0)
+
+toctree_pattern = re.compile(r"^\.\. toctree::[ \t]*\n((?:[ \t]+.*\n|[ \t]*\n)*)", re.M)
+skeleton_ref_pattern = re.compile(r":ref:`(?:[^`<]*<)?(\w+)_skl>?`")
+
+
+def get_workshops(source_dir=output_root_abs):
+    """mapping from workshop name to the names of the exercise pages in
+    the toctree of its exercises page"""
+    workshops = dict()
+    for fn in sorted(glob.glob(join(source_dir, "*" + ex_toc_postfix))):
+        with open(fn, encoding="utf-8") as f:
+            data = f.read()
+
+        pages = []
+        for match in toctree_pattern.finditer(data):
+            for line in match.group(1).split("\n"):
+                line = line.strip()
+                if line and not line.startswith(":"):
+                    pages.append(line)
+
+        workshops[basename(fn)[: -len(ex_toc_postfix)]] = pages
+
+    return workshops
+
+
+def get_skeleton_names(pages, source_dir=output_root_abs):
+    """names of the files of which skeletons are referred to in pages"""
+    names = []
+    for page in pages:
+        fn = join(source_dir, page + ".rst")
+        if not isfile(fn):
+            continue
+
+        with open(fn, encoding="utf-8") as f:
+            for name in skeleton_ref_pattern.findall(f.read()):
+                if name not in names:
+                    names.append(name)
+
+    return names
+
+
+class Bundle(object):
+    def __init__(self, name, fns):
+        self.name = name
+        self.fns = sorted(fns, key=lambda fn: base_name(fn)[1])
+
+    def members(self):
+        """generates tuples (archive name, contents) for the members, one at
+        a time, in a fixed order"""
+        for output, prefix in (("skl", "skeleton"), (None, "solution")):
+            for fn in self.fns:
+                name = "%s/%s.m" % (prefix, base_name(fn)[1])
+                yield name, MatlabFile.from_file(fn).source(output)
+
+    def member_hashes(self):
+        return [[name, hashlib.sha1(data).hexdigest()] for name, data in self.members()]
+
+    def write(self, fn):
+        """write the archive atomically, streaming each member"""
+        tmp_fn = fn + ".tmp"
+        with zipfile.ZipFile(tmp_fn, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self.members():
+                info = zipfile.ZipInfo(name, date_time=member_date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                with zf.open(info, "w") as f:
+                    f.write(data)
+
+        os.chmod(tmp_fn, 0o644)
+        os.replace(tmp_fn, fn)
+
+
+def get_bundles():
+    name2fn = dict((base_name(fn)[1], fn) for fn in get_all_fns())
+
+    bundles = []
+    for workshop, pages in sorted(get_workshops().items()):
+        names = get_skeleton_names(pages)
+        fns = [name2fn[name] for name in names if name in name2fn]
+        if fns:
+            bundles.append(Bundle("%s_exercises" % workshop, fns))
+
+    return bundles
+
+
+def build_bundles(bundles, output_dir):
+    """write the bundles whose members changed; returns the names of the
+    bundles written"""
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    manifest_fn = join(output_dir, manifest_name)
+    manifest = dict()
+    if isfile(manifest_fn):
+        with open(manifest_fn) as f:
+            manifest = json.load(f)
+
+    written = []
+    new_manifest = dict()
+    for bundle in bundles:
+        fn = join(output_dir, bundle.name + ".zip")
+        hashes = bundle.member_hashes()
+        if manifest.get(bundle.name) != hashes or not isfile(fn):
+            bundle.write(fn)
+            written.append(bundle.name)
+        new_manifest[bundle.name] = hashes
+
+    # remove bundles of workshops that do not exist anymore
+    for fn in glob.glob(join(output_dir, "*.zip")):
+        if basename(fn)[:-4] not in new_manifest:
+            os.remove(fn)
+
+    write_if_changed(manifest_fn, json.dumps(new_manifest, indent=1, sort_keys=True))
+    return written
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="build zip archives with exercise files for each workshop"
+    )
+    parser.add_argument("--output_dir", default=join(output_root_abs, bundles_rel))
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+
+    bundles = get_bundles()
+    written = build_bundles(bundles, args.output_dir)
+    print("Bundles: %d archives, %d written" % (len(bundles), len(written)))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# content-addressed cache for generated documentation files
+#
+# Generated files (rendered .txt/.rst files for each .m file, TOC files,
+# the gallery, the git summary, and the Sphinx doctrees) are stored under
+# a key computed from the hash of their inputs and the version of the tool
+# that generated them (the hash of the tool's source code). Generators
+# restore files from the cache, using hard links when possible, before
+# doing any work. Files that are modified in place afterwards (such as the
+# doctrees, which Sphinx rewrites) are restored as writable copies, as
+# changing a hard link would change the cached file. Restored files get
+# the current time as modification time (of the shared file, for hard
+# links), so that Sphinx and the generators consider them as new. Least
+# recently used entries are evicted when the cache grows beyond its
+# maximum size; recent use is tracked by the entry's meta.json.
+#
+# The cache is enabled by setting the COSMO_DOC_CACHE environment variable
+# to a directory (for example on a persistent volume of a CI runner); its
+# maximum size in megabytes is set by COSMO_DOC_CACHE_MAX_MB.
+#
+# The Sphinx doctrees (including the pickled environment) are cached
+# from the command line, keyed by the Sphinx version, conf.py and the tools
+# (which include the Sphinx extensions), but not by the other files in the
+# source directory. The doctrees of the last build are restored, and Sphinx
+# itself reads again the documents that are newer than these:
+#
+#   build_cache.py restore build/doctrees source
+#   sphinx-build -d build/doctrees ...
+#   build_cache.py save build/doctrees source
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from os.path import join, isfile, isdir, relpath, dirname
+
+default_max_mb = 1024
+
+
+def hash_file(fn):
+    h = hashlib.sha1()
+    with open(fn, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tool_version(fn):
+    """version of a tool: the hash of its source file"""
+    return hash_file(fn.replace(".pyc", ".py"))
+
+
+def canonical(content):
+    """content with newlines normalized to '\\n'"""
+    return content.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def write_file(fn, content):
+    """write content, with canonical newlines and UTF-8 encoding regardless
+    of the platform, by replacing fn atomically. Files restored from the
+    cache may be hard links to cached files, which therefore must never be
+    modified in place"""
+    fd, tmp_fn = tempfile.mkstemp(dir=dirname(fn) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+        f.write(canonical(content))
+    os.chmod(tmp_fn, 0o644)
+    os.replace(tmp_fn, fn)
+
+
+def list_files(d):
+    """all files in directory d, relative to d"""
+    fns = []
+    for root, _, files in os.walk(d):
+        fns.extend(relpath(join(root, fn), d) for fn in files)
+    return sorted(fns)
+
+
+class BuildCache(object):
+    meta_name = "meta.json"
+
+    def __init__(self, cache_dir, max_bytes=default_max_mb << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        if not isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @classmethod
+    def from_env(cls):
+        """returns a cache if COSMO_DOC_CACHE is set, otherwise None"""
+        cache_dir = os.getenv("COSMO_DOC_CACHE")
+        if not cache_dir:
+            return None
+
+        max_mb = int(os.getenv("COSMO_DOC_CACHE_MAX_MB", default_max_mb))
+        return cls(cache_dir, max_mb << 20)
+
+    @staticmethod
+    def key(tool, version, *inputs):
+        """key for the given tool, its version and its inputs (strings)"""
+        h = hashlib.sha1()
+        for part in (tool, version) + inputs:
+            data = part if isinstance(part, bytes) else ("%s" % part).encode("utf-8")
+            h.update(("%d:" % len(data)).encode("utf-8"))
+            h.update(data)
+        return h.hexdigest()
+
+    def entry_dir(self, key):
+        return join(self.cache_dir, key[:2], key[2:])
+
+    def restore(self, key, base_dir, link=True):
+        """restore the files stored under key into base_dir; returns True
+        if the key was found. With link=False, files are copied rather than
+        hard linked, so that they can be modified in place"""
+        entry_dir = self.entry_dir(key)
+        meta_fn = join(entry_dir, self.meta_name)
+        if not isfile(meta_fn):
+            self.misses += 1
+            return False
+
+        with open(meta_fn) as f:
+            meta = json.load(f)
+
+        for i, rel_fn in enumerate(meta["files"]):
+            src_fn = join(entry_dir, "%d" % i)
+            trg_fn = join(base_dir, rel_fn)
+
+            trg_dir = dirname(trg_fn)
+            if not isdir(trg_dir):
+                os.makedirs(trg_dir)
+
+            tmp_fn = trg_fn + ".cache.tmp"
+            if isfile(tmp_fn):
+                os.remove(tmp_fn)
+            linked = False
+            if link:
+                try:
+                    os.link(src_fn, tmp_fn)
+                    linked = True
+                except OSError:
+                    # e.g. the cache is on another file system
+                    pass
+
+            if not linked:
+                shutil.copyfile(src_fn, tmp_fn)
+                os.chmod(tmp_fn, 0o644)
+            os.replace(tmp_fn, trg_fn)
+
+            # a restored file is newer than its inputs, and than the last
+            # time Sphinx read it
+            os.utime(trg_fn, None)
+
+        # mark as recently used
+        os.utime(meta_fn, None)
+        self.hits += 1
+        return True
+
+    def store(self, key, base_dir, rel_fns, replace=False):
+        """store files (relative to base_dir) under key; with replace=True,
+        files already stored under key are replaced"""
+        entry_dir = self.entry_dir(key)
+        if isfile(join(entry_dir, self.meta_name)) and not replace:
+            return
+
+        parent_dir = dirname(entry_dir)
+        if not isdir(parent_dir):
+            os.makedirs(parent_dir)
+
+        # build the entry in a temporary directory, so that concurrent
+        # builds never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+        size = 0
+        for i, rel_fn in enumerate(rel_fns):
+            obj_fn = join(tmp_dir, "%d" % i)
+            shutil.copyfile(join(base_dir, rel_fn), obj_fn)
+            os.chmod(obj_fn, 0o444)
+            size += os.path.getsize(obj_fn)
+
+        with open(join(tmp_dir, self.meta_name), "w") as f:
+            json.dump(dict(files=list(rel_fns), size=size), f)
+
+        if replace and isdir(entry_dir):
+            old_dir = tempfile.mkdtemp(dir=parent_dir)
+            os.rename(entry_dir, join(old_dir, "entry"))
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # stored by another process in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def entries(self):
+        """returns a list of (last_used, size, entry_dir) tuples"""
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = join(self.cache_dir, prefix)
+            if not isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                meta_fn = join(prefix_dir, name, self.meta_name)
+                if not isfile(meta_fn):
+                    continue
+                with open(meta_fn) as f:
+                    size = json.load(f)["size"]
+                entries.append((os.path.getmtime(meta_fn), size, dirname(meta_fn)))
+        return entries
+
+    def evict(self):
+        """remove least recently used entries until the cache fits"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        removed = 0
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        return removed
+
+    def close(self):
+        removed = self.evict()
+        print(
+            "build cache: %d hits, %d misses, %d entries evicted"
+            % (self.hits, self.misses, removed)
+        )
+
+
+def cached_write(cache, key, fn, content):
+    """write content to fn and store it in the cache (if any)"""
+    write_file(fn, content)
+    if cache is not None:
+        cache.store(key, dirname(fn), [os.path.basename(fn)])
+
+
+def cached_restore(cache, key, fn):
+    """restore fn from the cache; returns False if not available"""
+    return cache is not None and cache.restore(key, dirname(fn))
+
+
+def doctrees_key(source_dir):
+    """key for the doctrees, based on conf.py in the source directory and
+    the tools; not on the documents, which Sphinx checks itself"""
+    h = hashlib.sha1(hash_file(join(source_dir, "conf.py")).encode("utf-8"))
+    tools_dir = dirname(os.path.abspath(__file__))
+    for fn in sorted(os.listdir(tools_dir)):
+        if fn.endswith(".py"):
+            h.update(fn.encode("utf-8"))
+            h.update(hash_file(join(tools_dir, fn)).encode("utf-8"))
+
+    try:
+        import sphinx
+
+        sphinx_version = sphinx.__version__
+    except ImportError:
+        sphinx_version = None
+
+    return BuildCache.key("doctrees", sphinx_version, h.hexdigest())
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="cache Sphinx doctrees in the documentation build cache"
+    )
+    parser.add_argument("action", choices=("restore", "save", "evict"))
+    parser.add_argument("doctrees_dir", nargs="?")
+    parser.add_argument("source_dir", nargs="?")
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    cache = BuildCache.from_env()
+    if cache is None:
+        print("COSMO_DOC_CACHE is not set, build cache disabled")
+        sys.exit(0)
+
+    if args.action != "evict":
+        if args.doctrees_dir is None or args.source_dir is None:
+            parser.error("doctrees_dir and source_dir are required")
+
+        key = doctrees_key(args.source_dir)
+
+        if args.action == "restore":
+            # Sphinx rewrites the doctrees in place
+            found = cache.restore(key, args.doctrees_dir, link=False)
+            print("doctrees %s" % ("restored" if found else "not in cache"))
+        elif isdir(args.doctrees_dir):
+            # the doctrees of the last build replace the earlier ones
+            cache.store(
+                key, args.doctrees_dir, list_files(args.doctrees_dir), replace=True
+            )
+            print("doctrees saved")
+
+    cache.close()
@@ -8,6 +8,8 @@
 import os
 import math
 
+from build_cache import BuildCache, tool_version, write_file
+
 
 class Image(object):
     def __init__(self, label, prefix, index):
@@ -227,13 +229,27 @@ class ImageCollection(object):
     def __len__(self):
         return len(self.images)
 
-    def write(self, fn=None):
+    def write(self, fn=None, cache=None):
         if fn is None:
             relative_fn = "../source/_static/demo_gallery.txt"
             fn = os.path.join(os.path.dirname(__file__), relative_fn)
 
-        with open(fn, "w") as f:
-            f.write(self.to_rst())
+        # the gallery depends only on the images found
+        cache_key = BuildCache.key(
+            "build_demo_images",
+            tool_version(__file__),
+            [(img.label, img.prefix, img.index, img.get_image_ref()) for img in self],
+        )
+        fn_dir, fn_base = os.path.split(fn)
+        if cache is not None and cache.restore(cache_key, fn_dir):
+            return
+
+        write_file(fn, self.to_rst())
+        if cache is not None:
+            cache.store(cache_key, fn_dir, [fn_base])
+
+    def __iter__(self):
+        return iter(self.images)
 
 
 if __name__ == "__main__":
@@ -276,4 +292,7 @@ if __name__ == "__main__":
 
     print(msg)
 
-    c.write()
+    cache = BuildCache.from_env()
+    c.write(cache=cache)
+    if cache is not None:
+        cache.close()
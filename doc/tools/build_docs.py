@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# builds the documentation: runs the generators and then sphinx-build
+#
+# The build is a set of stages with dependencies:
+#
+#   matlab          matlab2rst.py           .m files -> rst pages and TOCs
+#   gallery         build_demo_images.py    published images -> gallery
+#   git_summary     summarize_git_log.py    git log -> summary of changes
+#   function_index  build_function_index.py mvpa/*.m -> search index
+#   changelog       changelog2rst.py        Changelog -> pages for versions
+#   check_refs      check_refs.py           (after the stages above)
+#   sphinx          sphinx-build            (after all stages)
+#
+# Stages run concurrently as soon as the stages they depend on have
+# finished. A stage is skipped if its inputs (and the script itself) did
+# not change since it last succeeded, and its outputs exist. Status and
+# timing of each stage are reported at the end.
+#
+# All arguments not listed below are passed to sphinx-build, so that this
+# script can be used as SPHINXBUILD in the Makefile, e.g.:
+#
+#   build_docs.py -b html -d build/doctrees source build/html
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os.path import join, abspath, dirname, isfile, isdir
+
+doc_dir = dirname(dirname(abspath(__file__)))
+root_dir = dirname(doc_dir)
+source_dir = "source"
+
+default_state_fn = join("build", ".build_docs_state.json")
+
+m_file_patterns = [join(root_dir, d, "*.m") for d in ("mvpa", "examples", "tests")]
+publish_patterns = [join(source_dir, "_static", "publish", "*")]
+
+# modules imported by the scripts of the stages
+shared_modules = [join("tools", "matlab2rst.py"), join("tools", "build_cache.py")]
+
+
+def tool(name):
+    return [sys.executable, join("tools", name)]
+
+
+def expand(patterns):
+    fns = set()
+    for pattern in patterns:
+        fns.update(glob.glob(pattern, recursive=True))
+    return sorted(fns)
+
+
+def fingerprint(patterns, extra=()):
+    """hash of the names, sizes and modification times of the files
+    matching the patterns"""
+    h = hashlib.sha1()
+    for part in extra:
+        h.update(("%s\n" % part).encode("utf-8"))
+
+    for fn in expand(patterns):
+        st = os.stat(fn)
+        h.update(("%s %d %d\n" % (fn, st.st_size, st.st_mtime_ns)).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def git_head():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=root_dir, stderr=subprocess.DEVNULL
+        )
+        return output.decode("UTF-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Stage(object):
+    def __init__(
+        self,
+        name,
+        commands,
+        inputs=(),
+        outputs=(),
+        deps=(),
+        extra_inputs=(),
+        always=False,
+        stream=False,
+    ):
+        self.name = name
+        self.commands = commands
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.extra_inputs = list(extra_inputs)
+        self.always = always
+        self.stream = stream
+
+        self.status = "pending"
+        self.seconds = None
+        self.output = ""
+        self.fingerprint = None
+
+    def get_fingerprint(self):
+        scripts = [c[1] for c in self.commands if c[0] == sys.executable]
+        patterns = self.inputs + scripts + shared_modules
+        return fingerprint(patterns, self.extra_inputs + [self.commands])
+
+    def is_current(self, state):
+        if self.always or self.fingerprint != state.get(self.name):
+            return False
+
+        return all(expand([pattern]) for pattern in self.outputs)
+
+    def run(self, state, force=False):
+        start_time = time.time()
+        self.fingerprint = self.get_fingerprint()
+
+        if not force and self.is_current(state):
+            status = "skipped"
+        else:
+            status = "ok"
+            outputs = []
+            for command in self.commands:
+                if self.stream:
+                    returncode = subprocess.call(command, cwd=doc_dir)
+                else:
+                    process = subprocess.run(
+                        command,
+                        cwd=doc_dir,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                    )
+                    outputs.append(process.stdout.decode("UTF-8", "replace"))
+                    returncode = process.returncode
+
+                if returncode != 0:
+                    status = "failed"
+                    break
+
+            self.output = "".join(outputs)
+
+        # set the status last, as other stages wait for it
+        self.seconds = time.time() - start_time
+        self.status = status
+        return self
+
+
+def get_doctrees_dir(sphinx_args):
+    for i, arg in enumerate(sphinx_args[:-1]):
+        if arg == "-d":
+            return sphinx_args[i + 1]
+    return None
+
+
+def get_stages(sphinx_args):
+    stages = [
+        Stage(
+            "matlab",
+            [tool("matlab2rst.py")],
+            inputs=m_file_patterns + publish_patterns,
+            outputs=[
+                join(source_dir, "matlab", "*.rst"),
+                join(source_dir, "matindex*.rst"),
+            ],
+        ),
+        Stage(
+            "gallery",
+            [tool("build_demo_images.py")],
+            inputs=publish_patterns,
+            outputs=[join(source_dir, "_static", "demo_gallery.txt")],
+        ),
+        Stage(
+            "git_summary",
+            [tool("summarize_git_log.py")],
+            inputs=m_file_patterns,
+            outputs=[join(source_dir, "_static", "git_summary.txt")],
+            # the summary covers the month before the last commit
+            extra_inputs=[git_head()],
+        ),
+        Stage(
+            "function_index",
+            [tool("build_function_index.py")],
+            inputs=[join(root_dir, "mvpa", "cosmo_*.m")],
+            outputs=[join(source_dir, "_static", "function_index", "index.json")],
+        ),
+        Stage(
+            "changelog",
+            [tool("changelog2rst.py")],
+            inputs=[join(root_dir, "Changelog")],
+            outputs=[
+                join(source_dir, "changelog", "*.rst"),
+                join(source_dir, "_static", "changelog_toc.txt"),
+            ],
+        ),
+        Stage(
+            "bundles",
+            [tool("build_bundles.py")],
+            inputs=m_file_patterns
+            + [
+                join(source_dir, "*_ex_toc.rst"),
+                join(source_dir, "ex_*.rst"),
+            ],
+            outputs=[join(source_dir, "_static", "bundles", "*.zip")],
+        ),
+        Stage(
+            "check_refs",
+            [tool("check_refs.py")],
+            inputs=[join(source_dir, "**", "*.rst"), join(source_dir, "**", "*.txt")],
+            deps=["matlab", "gallery", "git_summary", "changelog"],
+        ),
+    ]
+
+    if sphinx_args:
+        commands = [["sphinx-build"] + sphinx_args]
+
+        doctrees_dir = get_doctrees_dir(sphinx_args)
+        if doctrees_dir is not None:
+            cache_args = [doctrees_dir, source_dir]
+            commands.insert(0, tool("build_cache.py") + ["restore"] + cache_args)
+            commands.append(tool("build_cache.py") + ["save"] + cache_args)
+
+        stages.append(
+            Stage(
+                "sphinx",
+                commands,
+                deps=[stage.name for stage in stages],
+                always=True,
+                stream=True,
+            )
+        )
+
+    return stages
+
+
+def run_stages(stages, state, force=False, max_workers=None):
+    """run stages in dependency order, concurrently where possible.
+    Stages that depend on a stage that failed are not run"""
+    name2stage = dict((stage.name, stage) for stage in stages)
+    pending = list(stages)
+    running = dict()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+        while pending or running:
+            for stage in list(pending):
+                dep_status = [name2stage[dep].status for dep in stage.deps]
+                if any(s in ("failed", "blocked") for s in dep_status):
+                    stage.status = "blocked"
+                    pending.remove(stage)
+                elif all(s in ("ok", "skipped") for s in dep_status):
+                    pending.remove(stage)
+                    stage.status = "running"
+                    future = executor.submit(stage.run, state, force)
+                    running[future] = stage
+
+            if not running:
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                future.result()
+                report_stage(stage)
+                if stage.status in ("ok", "skipped"):
+                    state[stage.name] = stage.fingerprint
+                else:
+                    state.pop(stage.name, None)
+
+
+def report_stage(stage):
+    if stage.output and stage.status != "skipped":
+        prefix = "[%s] " % stage.name
+        lines = stage.output.rstrip("\n").split("\n")
+        print("\n".join(prefix + line for line in lines))
+    print("[%s] %s (%.2fs)" % (stage.name, stage.status, stage.seconds))
+    sys.stdout.flush()
+
+
+def as_text(stages):
+    lines = ["%-16s %-8s %8s" % ("stage", "status", "seconds")]
+    for stage in stages:
+        seconds = "" if stage.seconds is None else "%.2f" % stage.seconds
+        lines.append("%-16s %-8s %8s" % (stage.name, stage.status, seconds))
+    return "\n".join(lines)
+
+
+def load_state(fn):
+    if isfile(fn):
+        with open(fn) as f:
+            return json.load(f)
+    return dict()
+
+
+def save_state(state, fn):
+    if not isdir(dirname(fn)):
+        os.makedirs(dirname(fn))
+    with open(fn, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="build the documentation; unknown arguments are "
+        "passed to sphinx-build",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="run all stages, even if up to date"
+    )
+    parser.add_argument(
+        "--stage_jobs",
+        type=int,
+        default=None,
+        help="maximum number of stages running concurrently",
+    )
+    parser.add_argument(
+        "--state", default=default_state_fn, help="file with fingerprints of stages"
+    )
+    parser.add_argument("--report", help="JSON output file with stage status")
+    return parser
+
+
+if __name__ == "__main__":
+    args, sphinx_args = get_argument_parser().parse_known_args()
+
+    os.chdir(doc_dir)
+    stages = get_stages(sphinx_args)
+    state = load_state(args.state)
+
+    start_time = time.time()
+    run_stages(stages, state, args.force, args.stage_jobs)
+    save_state(state, args.state)
+
+    print(as_text(stages))
+    print("Total %.2fs" % (time.time() - start_time))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(
+                [dict(name=s.name, status=s.status, seconds=s.seconds) for s in stages],
+                f,
+                indent=1,
+            )
+
+    success = all(stage.status in ("ok", "skipped") for stage in stages)
+    sys.exit(0 if success else 1)
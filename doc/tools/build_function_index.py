@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# builds a compact search index of the cosmo_* functions in mvpa/
+#
+# For each function the signature, the one-line summary and the names of
+# its parameters (input arguments, and options such as 'radius' listed in
+# the help text) are stored. The index is split into shards by the first
+# character(s) of the function name after 'cosmo_', written as
+# source/_static/function_index/<prefix>.json, so that the search widget
+# on the function_search page only has to fetch a few kilobytes per
+# lookup. index.json lists the available shards.
+
+import os
+import re
+import glob
+import json
+import argparse
+from os.path import join, basename
+
+from matlab2rst import matlab2parts, matlab_dir, output_root_abs
+from build_cache import write_file
+
+index_rel = "_static/function_index"
+function_prefix = "cosmo_"
+
+option_pattern = re.compile(r"^\s*'(\w+)'\s*,", re.M)
+arguments_pattern = re.compile(r"\((.*)\)")
+
+
+def get_parameters(signature, help_text):
+    """input arguments in the signature (except varargin), followed by
+    option names in the help text"""
+    match = arguments_pattern.search(signature)
+    args = match.group(1).split(",") if match else []
+
+    names = [a.strip() for a in args if a.strip() not in ("", "varargin", "~")]
+    for option in option_pattern.findall(help_text):
+        if option not in names:
+            names.append(option)
+
+    return names
+
+
+def get_entry(fn, mat=None):
+    """index entry of fn, with contents mat (read from fn if not given)"""
+    if mat is None:
+        with open(fn, encoding="utf-8") as f:
+            mat = f.read()
+
+    signature, summary, help_text, _ = matlab2parts(mat)
+
+    name = basename(fn)[:-2]
+    signature = re.sub(r"^function\s+", "", signature.replace("...", " "))
+    signature = " ".join(signature.split())
+    return [name, signature, summary, get_parameters(signature, help_text)]
+
+
+def shard_name(name, prefix_length):
+    """name of the shard for a function name; names not starting with a
+    letter go in shard '_'"""
+    if name.startswith(function_prefix):
+        name = name[len(function_prefix) :]
+
+    prefix = name[:prefix_length].lower()
+    return prefix if re.match(r"^[a-z0-9]+$", prefix) else "_"
+
+
+def build_index(fns, prefix_length=1):
+    """returns a dict mapping shard names to lists of entries"""
+    return as_shards([get_entry(fn) for fn in sorted(fns)], prefix_length)
+
+
+def as_shards(entries, prefix_length=1):
+    shards = dict()
+    for entry in sorted(entries):
+        shards.setdefault(shard_name(entry[0], prefix_length), []).append(entry)
+
+    return shards
+
+
+def write_index(shards, output_dir, prefix_length):
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    as_json = lambda x: json.dumps(x, separators=(",", ":"), sort_keys=True)
+
+    for shard, entries in shards.items():
+        write_file(join(output_dir, "%s.json" % shard), as_json(entries))
+
+    # remove shards of functions that do not exist anymore
+    for fn in glob.glob(join(output_dir, "*.json")):
+        shard = basename(fn)[:-5]
+        if shard != "index" and shard not in shards:
+            os.remove(fn)
+
+    counts = dict((shard, len(entries)) for shard, entries in shards.items())
+    index = dict(prefix_length=prefix_length, shards=counts)
+    write_file(join(output_dir, "index.json"), as_json(index))
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="build sharded search index of CoSMoMVPA functions"
+    )
+    parser.add_argument(
+        "--prefix_length",
+        type=int,
+        default=1,
+        help="number of characters (after 'cosmo_') used to assign "
+        "functions to shards",
+    )
+    parser.add_argument("--output_dir", default=join(output_root_abs, index_rel))
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+
+    fns = glob.glob(join(matlab_dir, function_prefix + "*.m"))
+    shards = build_index(fns, args.prefix_length)
+    write_index(shards, args.output_dir, args.prefix_length)
+
+    print(
+        "Function index: %d functions in %d shards"
+        % (sum(len(entries) for entries in shards.values()), len(shards))
+    )
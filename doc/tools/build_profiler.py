@@ -0,0 +1,191 @@
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# Sphinx extension that profiles the documentation build
+#
+# For each document it measures the time spent reading (from source-read
+# to doctree-read) and writing (from doctree-resolved to
+# html-page-context), and for each extension the time spent in its
+# callbacks for these events, per document. When the build is finished
+# the slowest documents, phases and callbacks are written to
+# build_profile.json and build_profile.txt in the build directory.
+#
+# The extension is enabled in conf.py by setting the environment variable
+# COSMO_DOC_PROFILE, e.g.:
+#
+#   COSMO_DOC_PROFILE=1 make html
+#
+# With parallel reading or writing (sphinx-build -j), work done in
+# worker processes is not measured.
+
+import os
+import json
+import time
+from collections import defaultdict
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+profiled_events = (
+    "source-read",
+    "doctree-read",
+    "doctree-resolved",
+    "html-page-context",
+)
+
+# (event that starts the phase, event that ends the phase) for each phase
+phase_events = dict(
+    read=("source-read", "doctree-read"),
+    write=("doctree-resolved", "html-page-context"),
+)
+
+
+def event_docname(app, event, args):
+    """name of the document an event (with arguments args, excluding
+    app) is emitted for"""
+    if event in ("source-read", "html-page-context"):
+        return args[0]
+    if event == "doctree-resolved":
+        return args[1]
+    return app.env.docname
+
+
+class BuildProfile(object):
+    def __init__(self):
+        # mapping from (event, extension) to seconds
+        self.callbacks = defaultdict(float)
+        # mapping from docname to mapping from phase or callback to seconds
+        self.docs = defaultdict(lambda: defaultdict(float))
+        self.starts = dict()
+
+    def start(self, phase, docname):
+        self.starts[(phase, docname)] = time.time()
+
+    def stop(self, phase, docname):
+        start = self.starts.pop((phase, docname), None)
+        if start is not None:
+            self.docs[docname][phase] += time.time() - start
+
+    def add_callback(self, event, extension, docname, seconds):
+        self.callbacks[(event, extension)] += seconds
+        self.docs[docname]["%s:%s" % (event, extension)] += seconds
+
+    def wrap(self, app, event, handler):
+        extension = getattr(handler, "__module__", None) or "unknown"
+
+        def timed_handler(*args, **kwargs):
+            start = time.time()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                docname = event_docname(app, event, args[1:])
+                self.add_callback(event, extension, docname, time.time() - start)
+
+        return timed_handler
+
+    def as_dict(self, count):
+        total = lambda times: sum(times.get(phase, 0.0) for phase in phase_events)
+        docs = sorted(self.docs.items(), key=lambda item: -total(item[1]))
+        callbacks = sorted(self.callbacks.items(), key=lambda item: -item[1])
+
+        phases = dict(
+            (phase, sum(times.get(phase, 0.0) for times in self.docs.values()))
+            for phase in phase_events
+        )
+
+        return dict(
+            phases=phases,
+            callbacks=[
+                dict(event=event, extension=extension, seconds=seconds)
+                for (event, extension), seconds in callbacks
+            ],
+            documents=[
+                dict(docname=docname, seconds=total(times), times=dict(times))
+                for docname, times in docs[:count]
+            ],
+        )
+
+    def as_text(self, count):
+        report = self.as_dict(count)
+        lines = ["Phases"]
+        for phase, seconds in sorted(report["phases"].items(), key=lambda x: -x[1]):
+            lines.append("  %8.3fs  %s" % (seconds, phase))
+
+        lines.append("Extension callbacks")
+        for c in report["callbacks"]:
+            lines.append("  %8.3fs  %s %s" % (c["seconds"], c["event"], c["extension"]))
+
+        lines.append("Slowest %d documents" % count)
+        for d in report["documents"]:
+            phases = " ".join(
+                "%s=%.3fs" % (phase, d["times"].get(phase, 0.0))
+                for phase in sorted(phase_events)
+            )
+            lines.append("  %8.3fs  %s (%s)" % (d["seconds"], d["docname"], phases))
+
+        return "\n".join(lines) + "\n"
+
+
+def install(app):
+    """wrap the callbacks of all extensions for the profiled events"""
+    profile = app.build_profile
+    for event in profiled_events:
+        listeners = app.events.listeners.get(event, [])
+        for i, listener in enumerate(listeners):
+            if getattr(listener.handler, "__module__", None) != __name__:
+                handler = profile.wrap(app, event, listener.handler)
+                listeners[i] = listener._replace(handler=handler)
+
+
+def start_phase(phase):
+    def start(app, *args):
+        docname = event_docname(app, phase_events[phase][0], args)
+        app.build_profile.start(phase, docname)
+
+    start.__module__ = __name__
+    return start
+
+
+def stop_phase(phase):
+    def stop(app, *args):
+        docname = event_docname(app, phase_events[phase][1], args)
+        app.build_profile.stop(phase, docname)
+
+    stop.__module__ = __name__
+    return stop
+
+
+def write_report(app, exception):
+    if exception is not None:
+        return
+
+    output_dir = app.config.build_profile_dir or os.path.dirname(
+        os.path.abspath(app.outdir)
+    )
+    count = app.config.build_profile_count
+
+    with open(os.path.join(output_dir, "build_profile.json"), "w") as f:
+        json.dump(app.build_profile.as_dict(count), f, indent=1)
+
+    text = app.build_profile.as_text(count)
+    with open(os.path.join(output_dir, "build_profile.txt"), "w") as f:
+        f.write(text)
+
+    logger.info("build profile written to %s" % output_dir)
+
+
+def setup(app):
+    app.build_profile = BuildProfile()
+    app.add_config_value("build_profile_dir", None, "")
+    app.add_config_value("build_profile_count", 30, "")
+
+    # start phases before, and stop them after, all other callbacks
+    for phase, (start_event, stop_event) in phase_events.items():
+        app.connect(start_event, start_phase(phase), priority=0)
+        app.connect(stop_event, stop_phase(phase), priority=1000)
+
+    app.connect("builder-inited", install)
+    app.connect("build-finished", write_report)
+    return dict(version="1.0", parallel_read_safe=True, parallel_write_safe=True)
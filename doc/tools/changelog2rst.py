@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# converts the Changelog to a page for each version
+#
+# The Changelog in the root directory is parsed into versions, each with
+# notes and sections (such as 'Fixed' or 'New features'), each with items
+# that may refer to functions using :ref:`cosmo_*`. The parsed model is
+# stored in source/changelog/.model.json and only parsed again when the
+# hash of the Changelog (or of this script) changes.
+#
+# From the model the following are generated:
+#
+# - source/changelog/<version>.rst: one page for each version
+# - source/changelog/functions.rst: for each function, the versions and
+#   sections in which it was mentioned
+# - source/_static/changelog_toc.txt: a list of versions, with a hidden
+#   toctree, included by changelog.rst
+#
+# Files are only written if their contents changed. With --release_notes,
+# the notes of a single version are printed instead, with references
+# replaced by literal text, for use outside the website.
+#
+# Usage:
+#   changelog2rst.py [--release_notes VERSION]
+
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+from os.path import join, isfile, basename
+
+from matlab2rst import doc_root_dir, output_root_abs, write_if_changed
+from build_cache import hash_file, tool_version
+
+changelog_fn = join(doc_root_dir, os.pardir, "Changelog")
+changelog_rel = "changelog"
+changelog_abs = join(output_root_abs, changelog_rel)
+model_fn = join(changelog_abs, ".model.json")
+toc_fn = join(output_root_abs, "_static", "changelog_toc.txt")
+functions_page_name = "functions"
+
+bullet_pattern = re.compile(r"^( *)\* (.*)$")
+version_pattern = re.compile(r"^(\S+)(?:\s+\((.*)\))?$")
+function_ref_pattern = re.compile(r":ref:`(cosmo_\w+)`")
+ref_pattern = re.compile(r":ref:`([^`<]*?)\s*(?:<[^`>]*>)?`")
+
+
+def parse_bullets(lines):
+    """returns a tree of bullets, as a list of dicts with keys 'text',
+    'line' (the line number of the bullet) and 'children'. Lines before the
+    first bullet are ignored; lines that are not bullets are appended to
+    the text of the previous bullet"""
+    root = dict(indent=-1, text=None, children=[])
+    stack = [root]
+
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+
+        match = bullet_pattern.match(line)
+        if match is None:
+            if len(stack) > 1:
+                stack[-1]["text"] += " " + line.strip()
+            continue
+
+        indent = len(match.group(1))
+        while stack[-1]["indent"] >= indent:
+            stack.pop()
+
+        text = match.group(2).strip()
+        node = dict(indent=indent, text=text, line=i + 1, children=[])
+        stack[-1]["children"].append(node)
+        stack.append(node)
+
+    return root["children"]
+
+
+def flatten(node):
+    """text of a bullet, followed by the text of its descendants"""
+    texts = [node["text"]]
+    for child in node["children"]:
+        texts.extend(flatten(child))
+    return texts
+
+
+def parse(text, fn=changelog_fn):
+    """returns a list of versions (most recent first), each a dict with
+    keys 'name', 'date', 'notes' and 'sections'. Each section is a dict with
+    keys 'name' and 'items', and each item a dict with keys 'text' and
+    'functions'. Top-level bullets that are not versions are skipped with
+    a warning"""
+    as_item = lambda t: dict(text=t, functions=function_ref_pattern.findall(t))
+
+    versions = []
+    for node in parse_bullets(text.split("\n")):
+        match = version_pattern.match(node["text"])
+        if match is None:
+            sys.stderr.write(
+                "%s:%d: not a version, skipped: %s\n" % (fn, node["line"], node["text"])
+            )
+            continue
+
+        name, date = match.groups()
+        version = dict(name=name, date=date, notes=[], sections=[])
+
+        for child in node["children"]:
+            if child["children"]:
+                items = [as_item(t) for c in child["children"] for t in flatten(c)]
+                version["sections"].append(dict(name=child["text"], items=items))
+            else:
+                version["notes"].append(as_item(child["text"]))
+
+        versions.append(version)
+
+    return versions
+
+
+def load_model(fn=changelog_fn, cache_fn=model_fn):
+    """the parsed Changelog, from the cache if the Changelog did not change"""
+    key = [hash_file(fn), tool_version(__file__)]
+    if isfile(cache_fn):
+        with open(cache_fn) as f:
+            try:
+                cached = json.load(f)
+            except ValueError:
+                cached = dict()
+
+        if cached.get("key") == key:
+            return cached["versions"]
+
+    with open(fn, encoding="utf-8") as f:
+        versions = parse(f.read(), fn)
+
+    if not os.path.isdir(os.path.dirname(cache_fn)):
+        os.makedirs(os.path.dirname(cache_fn))
+    write_if_changed(cache_fn, json.dumps(dict(key=key, versions=versions), indent=1))
+    return versions
+
+
+def version_label(version):
+    return "changelog_%s" % version["name"]
+
+
+def as_title(text, rep):
+    return "%s\n%s\n\n" % (text, rep * len(text))
+
+
+def version_title(version):
+    title = "CoSMoMVPA %s" % version["name"]
+    if version["date"]:
+        title += " (%s)" % version["date"]
+    return title
+
+
+def version_body(version):
+    parts = ["%s\n\n" % note["text"] for note in version["notes"]]
+    for section in version["sections"]:
+        parts.append(as_title(section["name"], "-"))
+        parts.extend("* %s\n" % item["text"] for item in section["items"])
+        parts.append("\n")
+    return "".join(parts)
+
+
+def version_page(version):
+    return "".join(
+        [
+            ".. _`%s`:\n\n" % version_label(version),
+            as_title(version_title(version), "="),
+            version_body(version),
+        ]
+    )
+
+
+def version_ref(version):
+    return ":ref:`%s <%s>`" % (version["name"], version_label(version))
+
+
+def function_versions(versions):
+    """mapping from function name to list of tuples (version, section
+    names) in which the function is mentioned"""
+    func2versions = dict()
+    for version in versions:
+        func2sections = dict()
+        for section in version["sections"]:
+            for item in section["items"]:
+                for func in item["functions"]:
+                    sections = func2sections.setdefault(func, [])
+                    if section["name"] not in sections:
+                        sections.append(section["name"])
+
+        for func, sections in func2sections.items():
+            func2versions.setdefault(func, []).append((version, sections))
+
+    return func2versions
+
+
+def functions_page(versions):
+    parts = [
+        ".. _`changelog_functions`:\n\n",
+        as_title("Changes by function", "="),
+    ]
+
+    func2versions = function_versions(versions)
+    for func in sorted(func2versions):
+        changes = "; ".join(
+            "%s (%s)" % (version_ref(version), ", ".join(sections))
+            for version, sections in func2versions[func]
+        )
+        parts.append("* :ref:`%s`: %s\n" % (func, changes))
+
+    return "".join(parts)
+
+
+def toc(versions):
+    page_names = [v["name"] for v in versions] + [functions_page_name]
+    parts = [
+        ".. toctree::\n    :hidden:\n\n",
+        "".join("    %s/%s\n" % (changelog_rel, name) for name in page_names),
+        "\n",
+    ]
+
+    for version in versions:
+        counts = ", ".join(
+            "%s (%d)" % (section["name"], len(section["items"]))
+            for section in version["sections"]
+        )
+        date = " (%s)" % version["date"] if version["date"] else ""
+        parts.append(
+            "* %s%s%s\n" % (version_ref(version), date, counts and ": " + counts)
+        )
+
+    parts.append("\nChanges by function: :ref:`changelog_functions`\n")
+    return "".join(parts)
+
+
+def write_pages(versions):
+    contents = dict((v["name"], version_page(v)) for v in versions)
+    contents[functions_page_name] = functions_page(versions)
+
+    n_written = 0
+    for name, content in contents.items():
+        n_written += write_if_changed(join(changelog_abs, name + ".rst"), content)
+    n_written += write_if_changed(toc_fn, toc(versions))
+
+    # remove pages of versions no longer in the Changelog
+    for fn in glob.glob(join(changelog_abs, "*.rst")):
+        if basename(fn)[:-4] not in contents:
+            os.remove(fn)
+
+    return n_written
+
+
+def release_notes(versions, name):
+    """notes of a version, with references replaced by literal text"""
+    for version in versions:
+        if version["name"] == name:
+            body = ref_pattern.sub(r"``\1``", version_body(version))
+            return as_title(version_title(version), "=") + body
+
+    raise ValueError("version %s not found in %s" % (name, changelog_fn))
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="convert the Changelog to a page for each version"
+    )
+    parser.add_argument(
+        "--release_notes", metavar="VERSION", help="print notes of a version"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+    versions = load_model()
+
+    if args.release_notes:
+        sys.stdout.write(release_notes(versions, args.release_notes))
+    else:
+        n_written = write_pages(versions)
+        print("Changelog: %d versions, %d files written" % (len(versions), n_written))
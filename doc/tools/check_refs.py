@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# checks that every :ref: in the documentation sources refers to a label
+#
+# All .rst and .txt files in source/ (both hand-written files, and those
+# generated by matlab2rst.py and summarize_git_log.py, so run these first)
+# are read once, and label definitions ('.. _label:') and references
+# (':ref:`label`' or ':ref:`text <label>`') are collected with a single
+# regular expression. References to labels that are not defined are
+# reported, so that broken references are found without running Sphinx.
+#
+# Usage:
+#   check_refs.py [source_dir]
+#
+# exits with status 1 if any reference is broken.
+
+import os
+import re
+import sys
+import argparse
+from os.path import join, relpath
+
+from matlab2rst import output_root_abs
+
+# a label definition (not followed by a URL, which would make it an
+# external hyperlink target), or a reference
+ref_pattern = re.compile(
+    r"^\.\. _(?:`(?P<quoted>[^`]+)`|(?P<label>[^`:][^:]*)):[ \t]*$"
+    r"|:ref:`(?P<ref>[^`]+)`",
+    re.M,
+)
+ref_target_pattern = re.compile(r"<([^<>]+)>\s*$")
+
+source_extensions = (".rst", ".txt")
+
+# labels defined by Sphinx itself
+builtin_labels = set(["genindex", "modindex", "search"])
+
+
+def normalize(label):
+    """labels are case-insensitive, and whitespace is collapsed"""
+    return " ".join(label.lower().split())
+
+
+def ref_target(ref):
+    """target label of the text of a :ref: role"""
+    match = ref_target_pattern.search(ref)
+    return match.group(1) if match else ref
+
+
+def find_sources(source_dir):
+    fns = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        fns.extend(
+            join(root, fn) for fn in sorted(files) if fn.endswith(source_extensions)
+        )
+    return fns
+
+
+def scan(fns):
+    """returns a set of defined labels, and a list of tuples
+    (filename, line number, label) of references"""
+    labels = set(builtin_labels)
+    refs = []
+    for fn in fns:
+        with open(fn, encoding="utf-8", errors="replace") as f:
+            data = f.read()
+
+        # line numbers are counted incrementally, as matches are in order
+        line = 1
+        pos = 0
+        for match in ref_pattern.finditer(data):
+            ref = match.group("ref")
+            if ref is None:
+                labels.add(normalize(match.group("quoted") or match.group("label")))
+            else:
+                line += data.count("\n", pos, match.start())
+                pos = match.start()
+                refs.append((fn, line, ref_target(ref)))
+
+    return labels, refs
+
+
+def broken_refs(source_dir):
+    labels, refs = scan(find_sources(source_dir))
+    return [ref for ref in refs if normalize(ref[2]) not in labels]
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="check :ref: targets in the documentation sources"
+    )
+    parser.add_argument("source_dir", nargs="?", default=output_root_abs)
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+
+    broken = broken_refs(args.source_dir)
+    for fn, line, label in broken:
+        print("%s:%d: undefined label '%s'" % (relpath(fn), line, label))
+
+    if broken:
+        print("%d broken references" % len(broken))
+        sys.exit(1)
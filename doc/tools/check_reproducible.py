@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# checks that the generated documentation sources are reproducible
+#
+# The generators (matlab2rst.py, build_demo_images.py,
+# summarize_git_log.py, build_function_index.py, changelog2rst.py and
+# build_bundles.py) are run twice, each time after removing their output,
+# and with a different PYTHONHASHSEED (so that output that depends on the
+# iteration order of sets or dicts is detected). The build cache is
+# disabled. Files whose hashes differ between the two runs, or that are
+# only generated in one run, are reported.
+#
+# Usage:
+#   check_reproducible.py
+#
+# exits with status 1 if the output is not reproducible.
+
+import os
+import sys
+import glob
+import shutil
+import hashlib
+import argparse
+import subprocess
+from os.path import join, isdir, relpath
+
+from matlab2rst import doc_root_dir, output_root_abs
+from build_cache import list_files
+
+generators = [
+    "matlab2rst.py",
+    "build_demo_images.py",
+    "summarize_git_log.py",
+    "build_function_index.py",
+    "changelog2rst.py",
+    "build_bundles.py",
+]
+
+# generated files and directories, relative to the source directory
+generated_patterns = [
+    "matlab",
+    "matindex*.rst",
+    "contents_demo*.rst",
+    "_static/demo_gallery.txt",
+    "_static/git_log.txt",
+    "_static/git_summary.txt",
+    "_static/function_index",
+    "changelog",
+    "_static/changelog_toc.txt",
+    "_static/bundles",
+]
+
+
+def generated_paths():
+    paths = []
+    for pattern in generated_patterns:
+        paths.extend(glob.glob(join(output_root_abs, pattern)))
+    return sorted(paths)
+
+
+def remove_generated():
+    for path in generated_paths():
+        if isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def hash_generated():
+    """mapping from generated file (relative to the source directory) to
+    the hash of its contents"""
+    hashes = dict()
+    for path in generated_paths():
+        fns = [join(path, fn) for fn in list_files(path)] if isdir(path) else [path]
+        for fn in fns:
+            with open(fn, "rb") as f:
+                hashes[relpath(fn, output_root_abs)] = hashlib.sha1(
+                    f.read()
+                ).hexdigest()
+    return hashes
+
+
+def generate(seed):
+    env = dict(os.environ)
+    env.pop("COSMO_DOC_CACHE", None)
+    env["PYTHONHASHSEED"] = str(seed)
+
+    for generator in generators:
+        subprocess.check_call(
+            [sys.executable, join("tools", generator)],
+            cwd=doc_root_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+
+
+def differences(hashes1, hashes2):
+    return sorted(
+        fn for fn in set(hashes1) | set(hashes2) if hashes1.get(fn) != hashes2.get(fn)
+    )
+
+
+def get_argument_parser():
+    return argparse.ArgumentParser(
+        description="check that generated documentation sources are reproducible"
+    )
+
+
+if __name__ == "__main__":
+    get_argument_parser().parse_args()
+
+    runs = []
+    for seed in (1, 2):
+        remove_generated()
+        generate(seed)
+        runs.append(hash_generated())
+
+    different = differences(*runs)
+    for fn in different:
+        print("not reproducible: %s" % fn)
+
+    print("%d generated files, %d not reproducible" % (len(runs[0]), len(different)))
+    if different:
+        sys.exit(1)
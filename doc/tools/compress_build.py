@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# minifies and precompresses the output of sphinx-build
+#
+# HTML, CSS and JavaScript files in the output directory are minified in
+# place, conservatively: whitespace is collapsed (but newlines are kept),
+# and HTML and CSS comments are removed. Contents of <pre>, <textarea>,
+# <script> and <style> elements, quoted strings and calc() expressions in
+# CSS, and JavaScript with strings that may span lines are not changed.
+# Then, for these and other text files, a gzip compressed copy (.gz), and
+# if the brotli module is available a brotli compressed copy (.br), is
+# written next to the file, so that a static web server can serve
+# precompressed files.
+#
+# Files are processed in parallel. The hash of each processed file is
+# stored in a manifest in the output directory; files with the same hash
+# in a later run (i.e. not rewritten by sphinx-build) are skipped.
+#
+# Usage:
+#   compress_build.py build/html
+
+import os
+import re
+import gzip
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join, isfile, relpath, splitext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+manifest_name = ".compress_manifest.json"
+
+# increase when minification or compression changes, so that all files
+# are processed again
+manifest_version = 2
+
+compress_extensions = (".html", ".css", ".js", ".json", ".txt", ".svg", ".xml")
+compressed_extensions = (".gz", ".br")
+
+# smaller files are not worth compressing
+min_compress_size = 256
+
+preserved_html_pattern = re.compile(
+    r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.S | re.I
+)
+html_comment_pattern = re.compile(r"<!--(?!\[if).*?-->", re.S)
+whitespace_pattern = re.compile(r"\s+")
+
+# in CSS, a quoted string, a comment, the start of a calc() expression, or
+# whitespace
+css_token_pattern = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\bcalc\()|\s+""",
+    re.S | re.I,
+)
+
+# in JavaScript, a backslash at the end of a line, which continues a string
+js_continuation_pattern = re.compile(r"\\[ \t]*$", re.M)
+
+
+def collapse_whitespace(text):
+    """replace whitespace by a newline if it contains a newline, and by a
+    space otherwise"""
+    return whitespace_pattern.sub(lambda m: "\n" if "\n" in m.group(0) else " ", text)
+
+
+def minify_html(text):
+    parts = preserved_html_pattern.split(text)
+
+    # split returns the text, the preserved element and its tag name
+    minified = []
+    for i in range(0, len(parts), 3):
+        minified.append(collapse_whitespace(html_comment_pattern.sub("", parts[i])))
+        if i + 1 < len(parts):
+            minified.append(parts[i + 1])
+
+    return "".join(minified)
+
+
+def closing_parenthesis(text, pos):
+    """position after the parenthesis that closes the one before pos, or
+    the length of text if it is not closed"""
+    depth = 1
+    while depth and pos < len(text):
+        depth += {"(": 1, ")": -1}.get(text[pos], 0)
+        pos += 1
+    return pos
+
+
+def minify_css(text):
+    """remove comments and collapse whitespace, except in quoted strings
+    and calc() expressions"""
+    minified = []
+    pos = 0
+    while True:
+        match = css_token_pattern.search(text, pos)
+        if match is None:
+            break
+
+        minified.append(text[pos : match.start()])
+        quoted, comment, calc = match.groups()
+        if quoted is not None:
+            minified.append(quoted)
+            pos = match.end()
+        elif comment is not None:
+            pos = match.end()
+        elif calc is not None:
+            pos = closing_parenthesis(text, match.end())
+            minified.append(text[match.start() : pos])
+        else:
+            minified.append(collapse_whitespace(match.group(0)))
+            pos = match.end()
+
+    minified.append(text[pos:])
+    return "".join(minified).strip() + "\n"
+
+
+def minify_js(text):
+    if "`" in text or js_continuation_pattern.search(text):
+        # template literals, and strings continued on the next line, may
+        # contain significant whitespace
+        return text
+
+    lines = (line.strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line) + "\n"
+
+
+minifiers = {".html": minify_html, ".css": minify_css, ".js": minify_js}
+
+
+def file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def write_bytes(fn, data):
+    tmp_fn = fn + ".tmp"
+    with open(tmp_fn, "wb") as f:
+        f.write(data)
+    os.replace(tmp_fn, fn)
+
+
+def process_file(fn, minify=True):
+    """minify and compress a file; returns the hash of the (minified)
+    file and the number of bytes saved by minification"""
+    with open(fn, "rb") as f:
+        data = f.read()
+
+    saved = 0
+    minifier = minifiers.get(splitext(fn)[1]) if minify else None
+    if minifier is not None:
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            text = None
+
+        if text is not None:
+            minified = minifier(text).encode("utf-8")
+            if len(minified) < len(data):
+                saved = len(data) - len(minified)
+                data = minified
+                write_bytes(fn, data)
+
+    if len(data) >= min_compress_size:
+        # mtime=0 makes the output independent of the time of the build
+        write_bytes(fn + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_bytes(fn + ".br", brotli.compress(data))
+
+    return file_hash(data), saved
+
+
+def find_files(output_dir):
+    fns = []
+    for root, _, files in os.walk(output_dir):
+        fns.extend(
+            join(root, fn)
+            for fn in files
+            if fn.endswith(compress_extensions) and fn != manifest_name
+        )
+    return sorted(fns)
+
+
+def remove_stale_compressed(output_dir):
+    """remove compressed files of which the original does not exist"""
+    count = 0
+    for root, _, files in os.walk(output_dir):
+        for fn in files:
+            base_fn, ext = splitext(fn)
+            if ext in compressed_extensions and not isfile(join(root, base_fn)):
+                os.remove(join(root, fn))
+                count += 1
+    return count
+
+
+class CompressManifest(object):
+    def __init__(self, output_dir):
+        self.fn = join(output_dir, manifest_name)
+        self.hashes = dict()
+
+        if isfile(self.fn):
+            with open(self.fn) as f:
+                content = json.load(f)
+            if content.get("version") == manifest_version:
+                self.hashes = content["files"]
+
+    def is_current(self, rel_fn, fn):
+        """True if fn was processed and has not changed since"""
+        recorded = self.hashes.get(rel_fn)
+        if recorded is None or (recorded[1] and not isfile(fn + ".gz")):
+            return False
+
+        with open(fn, "rb") as f:
+            return file_hash(f.read()) == recorded[0]
+
+    def save(self):
+        with open(self.fn, "w") as f:
+            json.dump(dict(version=manifest_version, files=self.hashes), f, indent=0)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="minify and precompress files generated by sphinx-build"
+    )
+    parser.add_argument("output_dir", help="output directory, e.g. build/html")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="number of processes"
+    )
+    parser.add_argument(
+        "--no_minify", action="store_true", help="only compress, do not minify"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="process all files, even if unchanged"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+
+    manifest = CompressManifest(args.output_dir)
+    if args.force:
+        manifest.hashes = dict()
+
+    todo = []
+    for fn in find_files(args.output_dir):
+        rel_fn = relpath(fn, args.output_dir)
+        if not manifest.is_current(rel_fn, fn):
+            todo.append((rel_fn, fn))
+
+    saved = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        fns = [fn for _, fn in todo]
+        minify = [not args.no_minify] * len(fns)
+        for (rel_fn, fn), (h, n) in zip(todo, executor.map(process_file, fns, minify)):
+            is_compressed = os.path.getsize(fn) >= min_compress_size
+            manifest.hashes[rel_fn] = [h, is_compressed]
+            saved += n
+
+    existing = set(relpath(fn, args.output_dir) for fn in find_files(args.output_dir))
+    for rel_fn in list(manifest.hashes):
+        if rel_fn not in existing:
+            del manifest.hashes[rel_fn]
+
+    removed = remove_stale_compressed(args.output_dir)
+    manifest.save()
+
+    print(
+        "Processed %d files (%d unchanged), minification saved %d bytes, "
+        "removed %d stale compressed files%s"
+        % (
+            len(todo),
+            len(manifest.hashes) - len(todo),
+            saved,
+            removed,
+            "" if brotli is not None else " (brotli not available, .br skipped)",
+        )
+    )
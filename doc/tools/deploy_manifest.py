@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# computes which files of the built website must be deployed
+#
+# A manifest with the size and hash of each file of the last deployed build
+# is kept. Compared to that manifest, files in the output directory
+# (build/html) are added, changed or removed. Actions:
+#
+#   plan    print the files to transfer and to remove; with --files_from,
+#           write both to a file for 'rsync --files-from' with
+#           '--delete-missing-args', which removes the files that are
+#           missing from the output directory on the receiving side
+#   delta   write a tarball with only the files to transfer, and the list
+#           of files to remove as '.deploy_removed.txt'
+#   commit  store the manifest of the output directory, after it was
+#           deployed (including the removal of files)
+#
+# Hashes are only computed for files whose size or modification time
+# differ from those in the manifest.
+#
+# Usage:
+#   deploy_manifest.py plan build/html --files_from build/deploy_files.txt
+#   rsync -rc --delete-missing-args --files-from=build/deploy_files.txt \
+#       build/html/ host:public_html/
+#   deploy_manifest.py commit build/html
+
+import os
+import io
+import sys
+import gzip
+import json
+import tarfile
+import argparse
+from os.path import join, isfile, relpath
+
+from build_cache import hash_file, write_file
+
+default_manifest_fn = join("build", ".deploy_manifest.json")
+
+removed_list_name = ".deploy_removed.txt"
+
+# files in the output directory that are not deployed
+excluded_names = set([".compress_manifest.json", removed_list_name])
+
+
+def load_manifest(fn):
+    """mapping from filename to dict with keys size, mtime_ns and sha1"""
+    if not isfile(fn):
+        return dict()
+
+    with open(fn) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, fn):
+    if os.path.dirname(fn) and not os.path.isdir(os.path.dirname(fn)):
+        os.makedirs(os.path.dirname(fn))
+    write_file(fn, json.dumps(manifest, indent=0, sort_keys=True))
+
+
+def scan(output_dir, previous=None):
+    """manifest of output_dir; hashes in previous are used for files with
+    the same size and modification time"""
+    if previous is None:
+        previous = dict()
+
+    manifest = dict()
+    for root, dirs, files in os.walk(output_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name in excluded_names:
+                continue
+
+            fn = join(root, name)
+            rel_fn = relpath(fn, output_dir)
+            st = os.stat(fn)
+
+            entry = previous.get(rel_fn)
+            if (
+                entry is None
+                or entry["size"] != st.st_size
+                or entry["mtime_ns"] != st.st_mtime_ns
+            ):
+                entry = dict(size=st.st_size, sha1=hash_file(fn))
+            else:
+                entry = dict(entry)
+
+            entry["mtime_ns"] = st.st_mtime_ns
+            manifest[rel_fn] = entry
+
+    return manifest
+
+
+class DeployPlan(object):
+    def __init__(self, added, changed, removed, sizes):
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        # mapping from filename to size, for files to transfer
+        self.sizes = sizes
+
+    @staticmethod
+    def from_manifests(deployed, current):
+        added = sorted(set(current) - set(deployed))
+        removed = sorted(set(deployed) - set(current))
+        changed = sorted(
+            fn
+            for fn in set(current) & set(deployed)
+            if current[fn]["sha1"] != deployed[fn]["sha1"]
+        )
+
+        sizes = dict((fn, current[fn]["size"]) for fn in added + changed)
+        return DeployPlan(added, changed, removed, sizes)
+
+    def transfer(self):
+        return sorted(self.added + self.changed)
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def summary(self):
+        return "%d added, %d changed, %d removed; %.1f MB to transfer" % (
+            len(self.added),
+            len(self.changed),
+            len(self.removed),
+            sum(self.sizes.values()) / 1e6,
+        )
+
+    def as_text(self):
+        lines = []
+        for label, fns in (
+            ("A", self.added),
+            ("M", self.changed),
+            ("D", self.removed),
+        ):
+            lines.extend("%s %s" % (label, fn) for fn in fns)
+        lines.append(self.summary())
+        return "\n".join(lines) + "\n"
+
+    def write_files_from(self, fn):
+        """list of files to transfer and to remove, in the format of rsync
+        --files-from; the files to remove are missing from the output
+        directory, so that rsync --delete-missing-args removes them"""
+        fns = sorted(self.transfer() + self.removed)
+        write_file(fn, "".join("%s\n" % f for f in fns))
+
+    def write_tarball(self, fn, output_dir):
+        """gzipped tarball with the files to transfer, and the list of
+        removed files. The tarball only depends on these files: the list
+        gets the latest modification time of the files to transfer, and
+        the gzip header has no timestamp"""
+        fns = self.transfer()
+        mtimes = [int(os.path.getmtime(join(output_dir, f))) for f in fns]
+
+        with open(fn, "wb") as f, gzip.GzipFile(
+            filename="", mode="wb", fileobj=f, mtime=0
+        ) as gz, tarfile.open(fileobj=gz, mode="w") as tar:
+            for rel_fn in fns:
+                tar.add(join(output_dir, rel_fn), arcname=rel_fn, recursive=False)
+
+            removed = "".join("%s\n" % f for f in self.removed).encode("utf-8")
+            info = tarfile.TarInfo(removed_list_name)
+            info.size = len(removed)
+            info.mtime = max(mtimes) if mtimes else 0
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(removed))
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="plan incremental deployment of the built website"
+    )
+    parser.add_argument("action", choices=("plan", "delta", "commit"))
+    parser.add_argument("output_dir", help="directory with the built website")
+    parser.add_argument(
+        "--manifest",
+        default=default_manifest_fn,
+        help="manifest of the last deployment",
+    )
+    parser.add_argument(
+        "--files_from",
+        help="file to write the files to transfer and to remove to (for plan)",
+    )
+    parser.add_argument("--tarball", help="tarball to write (for delta)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+
+    deployed = load_manifest(args.manifest)
+    current = scan(args.output_dir, deployed)
+
+    if args.action == "commit":
+        save_manifest(current, args.manifest)
+        print("Stored manifest of %d files in %s" % (len(current), args.manifest))
+        sys.exit(0)
+
+    plan = DeployPlan.from_manifests(deployed, current)
+
+    if args.action == "plan":
+        sys.stdout.write(plan.as_text())
+        if args.files_from:
+            plan.write_files_from(args.files_from)
+    else:
+        if not args.tarball:
+            raise ValueError("delta requires --tarball")
+        plan.write_tarball(args.tarball, args.output_dir)
+        print("%s: %s" % (args.tarball, plan.summary()))
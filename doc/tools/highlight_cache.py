@@ -0,0 +1,158 @@
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# Sphinx extension that caches syntax-highlighted code blocks
+#
+# Every page generated by matlab2rst.py embeds a full .m file as a code
+# block, and contents_demo.rst embeds all demos, so highlighting takes a
+# large part of a full build. This extension wraps the highlighter of the
+# builder, and stores the highlighted HTML keyed by the hash of the
+# source, the lexer, the highlighting options, and the Pygments style;
+# the cache is invalidated when the Pygments version changes. The cache is
+# stored next to the doctrees, so it is also saved and restored by
+# build_cache.py.
+#
+# Entries not used during highlight_cache_max_age consecutive builds are
+# removed. Warnings emitted by Pygments when highlighting a block (e.g.
+# for code that cannot be lexed) are only shown the first time. With
+# parallel writing (sphinx-build -j), blocks highlighted in worker
+# processes are not added to the cache.
+
+import os
+import pickle
+import hashlib
+
+import pygments
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+cache_name = "highlight_cache.pickle"
+
+# increase when the format of the cache changes
+cache_version = 2
+
+
+class PersistentCache(object):
+    """dictionary that is pickled between builds. Entries not used during
+    max_age consecutive builds are removed when saving"""
+
+    def __init__(self, fn, version, max_age=10):
+        self.fn = fn
+        self.version = version
+        self.max_age = max_age
+
+        # mapping from key to tuple (value, build number when last used)
+        self.entries = dict()
+        self.build = 0
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(fn):
+            try:
+                with open(fn, "rb") as f:
+                    stored_version, build, entries = pickle.load(f)
+            except (EOFError, ValueError, TypeError, pickle.UnpicklingError):
+                stored_version = None
+
+            if stored_version == version:
+                self.build = build + 1
+                self.entries = entries
+
+    def get(self, key, compute):
+        """returns the value for key, using compute() if not cached"""
+        entry = self.entries.get(key)
+        if entry is None:
+            value = compute()
+            self.misses += 1
+        else:
+            value = entry[0]
+            self.hits += 1
+
+        self.entries[key] = (value, self.build)
+        return value
+
+    def save(self):
+        entries = dict(
+            (key, entry)
+            for key, entry in self.entries.items()
+            if self.build - entry[1] < self.max_age
+        )
+
+        parent_dir = os.path.dirname(self.fn)
+        if not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir)
+
+        tmp_fn = self.fn + ".tmp"
+        with open(tmp_fn, "wb") as f:
+            pickle.dump(
+                (self.version, self.build, entries),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_fn, self.fn)
+
+    def summary(self):
+        return "%d hits, %d misses, %d entries" % (
+            self.hits,
+            self.misses,
+            len(self.entries),
+        )
+
+
+class HighlightCache(PersistentCache):
+    def __init__(self, fn, style, max_age=10):
+        version = (cache_version, pygments.__version__)
+        super(HighlightCache, self).__init__(fn, version, max_age)
+        self.style = style
+
+    def key(self, source, lang, opts, force, kwargs):
+        """key of a code block; kwargs are the formatter arguments (such as
+        linenos, hl_lines and linenostart), except the location, which is
+        only used for warnings"""
+        source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        opts_str = repr(sorted((opts or dict()).items()))
+        kwargs_str = repr(sorted((k, v) for k, v in kwargs.items() if k != "location"))
+        return (source_hash, lang, self.style, opts_str, force, kwargs_str)
+
+    def wrap(self, highlight_block):
+        """returns a cached version of the highlight_block method of a
+        sphinx.highlighting.PygmentsBridge"""
+
+        def cached_highlight_block(source, lang, opts=None, force=False, **kwargs):
+            compute = lambda: highlight_block(
+                source, lang, opts=opts, force=force, **kwargs
+            )
+            return self.get(self.key(source, lang, opts, force, kwargs), compute)
+
+        return cached_highlight_block
+
+
+def install(app):
+    highlighter = getattr(app.builder, "highlighter", None)
+    if highlighter is None:
+        return
+
+    fn = os.path.join(app.doctreedir, cache_name)
+    cache = HighlightCache(
+        fn, app.config.pygments_style, app.config.highlight_cache_max_age
+    )
+    highlighter.highlight_block = cache.wrap(highlighter.highlight_block)
+    app.highlight_cache = cache
+
+
+def save(app, exception):
+    cache = getattr(app, "highlight_cache", None)
+    if cache is None or exception is not None:
+        return
+
+    cache.save()
+    logger.info("highlight cache: %s" % cache.summary())
+
+
+def setup(app):
+    app.add_config_value("highlight_cache_max_age", 10, "")
+    app.connect("builder-inited", install)
+    app.connect("build-finished", save)
+    return dict(version="1.0", parallel_read_safe=True, parallel_write_safe=True)
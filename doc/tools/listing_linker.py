@@ -0,0 +1,197 @@
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# Sphinx extension that links cosmo_* function names in code listings
+#
+# In every <pre> block of a generated HTML page (highlighted code,
+# and parsed literals such as the git summary), names of CoSMoMVPA
+# functions are linked to their page in matlab/. Names already inside a
+# link are not changed, and neither is the name of the function on its
+# own page.
+#
+# All function names (from CoSMoModules in matlab2rst.py and the .m files
+# in mvpa/) are combined into a single regular expression, structured as
+# a trie, so that each block is scanned once regardless of the number of
+# functions; tags are matched by the same expression, so that names inside
+# tags or links are skipped without scanning the block again. Linked
+# blocks are cached between builds, keyed by the hash of the block.
+
+import os
+import re
+import glob
+import hashlib
+
+from sphinx.util import logging
+
+from matlab2rst import modules, matlab_dir
+from highlight_cache import PersistentCache
+
+logger = logging.getLogger(__name__)
+
+cache_name = "listing_linker.pickle"
+
+# increase when the output of the linker changes
+linker_version = 2
+
+pre_pattern = re.compile(r"(<pre\b[^>]*>)(.*?)(</pre>)", re.S)
+
+# a start or end tag, with groups for the slash and the tag name
+tag_regex = r"<(/?)(\w*)[^>]*>"
+
+
+name_placeholder = "LISTINGLINKERNAME"
+
+
+def trie_regex(words):
+    """regular expression matching any of the words, in which words with
+    a common prefix share the prefix"""
+    trie = dict()
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, dict())
+        node[""] = None
+
+    def as_regex(node):
+        is_end = "" in node
+        branches = [
+            re.escape(c) + as_regex(child)
+            for c, child in sorted(node.items())
+            if c != ""
+        ]
+
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+
+        regex = "(?:%s)" % "|".join(branches)
+        return regex + "?" if is_end else regex
+
+    return as_regex(trie)
+
+
+def get_function_names():
+    names = set(
+        modules.prefix + name
+        for func_names in modules._name2funcs.values()
+        for name in func_names
+    )
+    names.update(
+        os.path.basename(fn)[:-2] for fn in glob.glob(os.path.join(matlab_dir, "*.m"))
+    )
+    return names
+
+
+class ListingLinker(object):
+    def __init__(self, names, cache=None):
+        self.names = sorted(names)
+        self.prefix = os.path.commonprefix(self.names)
+        self.pattern = re.compile(
+            r"%s|(%s)(?!\w)" % (tag_regex, trie_regex(self.names))
+        )
+        self.cache = cache
+
+    @property
+    def version(self):
+        names_hash = hashlib.sha1("\n".join(self.names).encode("utf-8"))
+        return (linker_version, names_hash.hexdigest())
+
+    def link_block(self, block, template, skip_name):
+        if not self.names or self.prefix not in block:
+            return block
+
+        parts = []
+        pos = 0
+        in_link = False
+        for match in self.pattern.finditer(block):
+            name = match.group(3)
+            if name is None:
+                # a tag
+                if match.group(2).lower() == "a":
+                    in_link = not match.group(1)
+                continue
+
+            start = match.start()
+            if (
+                in_link
+                or name == skip_name
+                or (
+                    start > 0
+                    and (block[start - 1].isalnum() or block[start - 1] in "_.")
+                )
+            ):
+                continue
+
+            url = template.replace(name_placeholder, name)
+            parts.append(block[pos:start])
+            parts.append('<a class="reference internal" href="%s">%s</a>' % (url, name))
+            pos = match.end()
+
+        parts.append(block[pos:])
+        return "".join(parts)
+
+    def link_body(self, body, template, skip_name=None):
+        """link function names in all <pre> blocks in body. template is
+        the URL of a function page, with the name replaced by
+        name_placeholder"""
+
+        def link(match):
+            open_tag, block, close_tag = match.groups()
+            compute = lambda: self.link_block(block, template, skip_name)
+
+            if self.cache is None:
+                linked = compute()
+            else:
+                block_hash = hashlib.sha1(block.encode("utf-8")).hexdigest()
+                key = (block_hash, template, skip_name)
+                linked = self.cache.get(key, compute)
+
+            return open_tag + linked + close_tag
+
+        return pre_pattern.sub(link, body)
+
+
+def get_linker(app):
+    """the linker, created when the first page is written (when all
+    documents are known)"""
+    linker = getattr(app, "listing_linker", None)
+    if linker is None:
+        found_docs = app.env.found_docs
+        names = [
+            name for name in get_function_names() if "matlab/" + name in found_docs
+        ]
+        linker = ListingLinker(names)
+
+        fn = os.path.join(app.doctreedir, cache_name)
+        linker.cache = PersistentCache(fn, linker.version)
+        app.listing_linker = linker
+
+    return linker
+
+
+def link_page(app, pagename, templatename, context, doctree):
+    if app.builder.format != "html" or "body" not in context:
+        return
+
+    linker = get_linker(app)
+    template = app.builder.get_relative_uri(pagename, "matlab/" + name_placeholder)
+    skip_name = pagename[len("matlab/") :] if pagename.startswith("matlab/") else None
+
+    context["body"] = linker.link_body(context["body"], template, skip_name)
+
+
+def save(app, exception):
+    linker = getattr(app, "listing_linker", None)
+    if linker is None or exception is not None:
+        return
+
+    linker.cache.save()
+    logger.info("listing linker cache: %s" % linker.cache.summary())
+
+
+def setup(app):
+    app.connect("html-page-context", link_page)
+    app.connect("build-finished", save)
+    return dict(version="1.0", parallel_read_safe=True, parallel_write_safe=True)
@@ -21,9 +21,15 @@
 import os
 import glob
 import sys
+import json
+import argparse
+import itertools
+from array import array
 from os.path import join, split, getmtime, isfile, abspath, basename
 from os import pardir
 
+from build_cache import BuildCache, canonical, tool_version, write_file
+
 
 def get_absolute_root_dir():
     parent_dir = lambda x: abspath(join(x, pardir))
@@ -35,7 +41,6 @@ def get_absolute_root_dir():
 
     for k in range(max_levels):
         pth_parent = parent_dir(pth)
-        print(pth, pth_parent)
 
         contents = glob.glob(join(pth_parent, "*"))
         contents_rel = list(map(basename, contents))
@@ -62,9 +67,10 @@ output_mat_abs = join(output_root_abs, output_mat_rel)
 
 publish_rel = join("_static/publish")
 
-for d in (output_root_abs, output_index_abs, output_mat_abs):
-    if not os.path.isdir(d):
-        os.makedirs(d)
+toc_model_fn = join(output_mat_abs, ".toc_model.json")
+
+# maximum number of full listings per page; 0 means no maximum
+full_listing_page_size = 5
 
 add_indent = lambda x: " " * 4 + x
 
@@ -75,41 +81,140 @@ def matlab2rst(data, output=None):
     skl: skeleton
     None: full
     (note: 'sgn' was once present but removed)"""
+    return MatlabFile(data).to_rst(output)
 
-    lines = data.split("\n")
-    after_header = False
-    in_skeleton = False
 
-    res = []
-    for i, line in enumerate(lines):
-        if in_skeleton and "% <@@<" in line.strip():
-            in_skeleton = False
-            continue
-
-        if not in_skeleton and "% >@@>" in line.strip():
-            if output == "skl":
-                res.append(line.replace("% >@@>", "%%%% >>> Your code here <<< %%%%"))
-            in_skeleton = True
-            continue
-
-        if not after_header:
-            if not ((i == 0 and "function" in line) or line.startswith("%")):
-                after_header = True
-
-        add_line = (
-            (output is None)
-            or (output == "skl" and not in_skeleton)
-            or (output in ("hdr", "sgn") and not after_header)
-        )
+# kinds of lines in a MatlabFile (bit flags)
+LINE_HEADER = 1
+LINE_SKELETON = 2
+LINE_SKELETON_START = 4
+LINE_SKELETON_END = 8
+
+skeleton_start = b"% >@@>"
+skeleton_end = b"% <@@<"
+skeleton_replacement = b"%%%% >>> Your code here <<< %%%%"
+
+
+class MatlabFile(object):
+    """contents of a matlab file, stored once as UTF-8 bytes, with the
+    offset, length and kind of each line in an array. The versions of the
+    file (see matlab2rst) are made from views of the contents"""
+
+    __slots__ = ("data", "lines")
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        # newlines as when reading in text mode
+        self.data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        # offset, length and kind of each line, one after the other
+        self.lines = array("i")
+        self._index()
+
+    @classmethod
+    def from_file(cls, fn):
+        with open(fn, "rb") as f:
+            return cls(f.read())
+
+    def _index(self):
+        data = self.data
+        after_header = False
+        in_skeleton = False
+
+        offset = 0
+        for i in itertools.count():
+            end = data.find(b"\n", offset)
+            if end < 0:
+                end = len(data)
 
-        if add_line:
-            res.append(line)
+            if in_skeleton and data.find(skeleton_end, offset, end) >= 0:
+                in_skeleton = False
+                kind = LINE_SKELETON_END
+            elif not in_skeleton and data.find(skeleton_start, offset, end) >= 0:
+                in_skeleton = True
+                kind = LINE_SKELETON_START
+            else:
+                if not after_header:
+                    is_function = i == 0 and data.find(b"function", offset, end) >= 0
+                    if not (is_function or data.startswith(b"%", offset, end)):
+                        after_header = True
+
+                kind = 0 if after_header else LINE_HEADER
+                if in_skeleton:
+                    kind |= LINE_SKELETON
+
+            self.lines.extend((offset, end - offset, kind))
+
+            if end == len(data):
+                break
+            offset = end + 1
+
+        if in_skeleton:
+            raise ValueError("%s\n\n: no end of skeleton", data)
+
+    def __len__(self):
+        return len(self.lines) // 3
+
+    def line_views(self, output=None):
+        """generates the lines for output (see matlab2rst) as views of the
+        contents; only the skeleton marker is copied (for output 'skl')"""
+        view = memoryview(self.data)
+        lines = self.lines
+        for i in range(0, len(lines), 3):
+            offset, length, kind = lines[i], lines[i + 1], lines[i + 2]
+
+            if kind & LINE_SKELETON_END:
+                continue
+
+            if kind & LINE_SKELETON_START:
+                if output == "skl":
+                    line = self.data[offset : offset + length]
+                    yield line.replace(skeleton_start, skeleton_replacement)
+                continue
+
+            add_line = (
+                (output is None)
+                or (output == "skl" and not kind & LINE_SKELETON)
+                or (output in ("hdr", "sgn") and kind & LINE_HEADER)
+            )
+
+            if add_line:
+                yield view[offset : offset + length]
+
+    def text(self):
+        return self.data.decode("utf-8")
+
+    def text_lines(self):
+        """generates all lines, decoded one at a time"""
+        view = memoryview(self.data)
+        lines = self.lines
+        for i in range(0, len(lines), 3):
+            yield str(view[lines[i] : lines[i] + lines[i + 1]], "utf-8")
 
-    if in_skeleton:
-        raise ValueError("%s\n\n: no end of skeleton", data)
+    def source(self, output=None):
+        """the matlab code for output, as UTF-8 bytes"""
+        return b"\n".join(self.line_views(output))
 
-    header = [".. code-block:: matlab", ""]
-    return "\n".join(header + list(map(add_indent, res)))
+    def to_rst(self, output=None):
+        lines = list(self.line_views(output))
+        rst = b".. code-block:: matlab\n"
+        if lines:
+            rst += b"\n    " + b"\n    ".join(lines)
+        return rst.decode("utf-8")
+
+    def summary(self):
+        """the first doc line (see matlab2parts), for which only the first
+        lines are decoded"""
+        summary_lines = []
+        for part, line in iter_parts(self.text_lines()):
+            if part > 1:
+                break
+            if part == 1:
+                summary_lines.append(line)
+
+        return join_part(1, summary_lines)
 
 
 def remove_trailing_percent(data):
@@ -125,11 +230,9 @@ def remove_trailing_percent(data):
     return "".join(r)
 
 
-def matlab2parts(data):
-    """Converts data to tuple (function sepc, first doc line, other doc lines, body)"""
-    lines = data.split("\n")
-
-    parts = [[] for i in range(4)]
+def iter_parts(lines):
+    """generates tuples (part, line) for each line, where part is the index
+    of the part (see matlab2parts) and line is None if it is left out"""
     stage = 0
     for i, line in enumerate(lines):
         line = line.strip()
@@ -153,18 +256,25 @@ def matlab2parts(data):
         elif stage == 2:
             line = remove_trailing_percent(line)
 
-        parts[stage].append(line)
+        yield stage, line
 
         if next_stage and not is_continuation:
             stage += 1
 
-    rs = []
-    for i, part in enumerate(parts):
-        # first explanatory line is concatenated without newline
-        sep = " " if i == 1 else "\n"
-        rs.append(sep.join([p for p in part if p is not None]))
 
-    return tuple(rs)
+def join_part(i, lines):
+    # first explanatory line is concatenated without newline
+    sep = " " if i == 1 else "\n"
+    return sep.join([p for p in lines if p is not None])
+
+
+def matlab2parts(data):
+    """Converts data to tuple (function sepc, first doc line, other doc lines, body)"""
+    parts = [[] for i in range(4)]
+    for stage, line in iter_parts(data.split("\n")):
+        parts[stage].append(line)
+
+    return tuple(join_part(i, part) for i, part in enumerate(parts))
 
 
 class RSTType(object):
@@ -201,8 +311,8 @@ class RSTType(object):
         )[self.prefix]
 
     def get_title(self, tp):
-        suffix = "" if tp is None else " - %s" % rst_type.type2name(output)
-        return "%s%s" % (rst_type.get_name(), suffix)
+        suffix = "" if tp is None else " - %s" % self.type2name(tp)
+        return "%s%s" % (self.get_name(), suffix)
 
     def get_postfix(self):
         return "" if self.prefix == "cosmo" else "_" + self.prefix
@@ -242,41 +352,45 @@ class RSTTable(object):
     def __init__(self):
         self.elements = []
 
+        # column widths and number of RSTModRef elements, updated as
+        # elements are added
+        self._widths = None
+        self._n_refs = 0
+
     def add(self, element):
         self.elements.append(element)
 
+        if isinstance(element, RSTModRef):
+            ws = element.widths()
+            if self._widths is None:
+                self._widths = ws
+            else:
+                assert len(self._widths) == len(ws)
+                self._widths = list(map(max, self._widths, ws))
+            self._n_refs += 1
+
     def __len__(self):
-        return len([e for e in self.elements if isinstance(e, RSTModRef)])
+        return self._n_refs
 
     def widths(self):
-        widths = None
-        for element in self.elements:
-            if isinstance(element, RSTModRef):
-                ws = element.widths()
-                if widths is None:
-                    widths = ws
-                else:
-                    assert len(widths) == len(ws)
-                    for i, w in enumerate(ws):
-                        if w > widths[i]:
-                            widths[i] = w
-        return widths
+        return None if self._widths is None else list(self._widths)
 
     def names(self):
         return [e.name for e in self.elements if isinstance(e, RSTModRef)]
 
     def __str__(self):
-        widths = self.widths()
+        widths = self._widths
         h = self.hline()
         lines = [h] + [element.to_lines(widths) for element in self.elements] + [h]
         return "".join(lines)
 
     def hline(self):
-        widths = self.widths()
-        return " ".join(["=" * w for w in widths]) + "\n"
+        return " ".join(["=" * w for w in self._widths]) + "\n"
 
 
 class RSTHeader(object):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -287,6 +401,8 @@ class RSTHeader(object):
 
 
 class RSTModRef(object):
+    __slots__ = ("name", "desc")
+
     def __init__(self, name, desc):
         self.name = name
         self.desc = desc
@@ -510,7 +626,7 @@ class CoSMoModules(object):
             missed = set(name2desc) - set(table.names())
             if len(missed):
                 table.add(RSTHeader("Other functions (possibly experimental)"))
-                for name in missed:
+                for name in sorted(missed):
                     table.add(RSTModRef(name, name2desc[name]))
         else:
             table = RSTTable()
@@ -534,113 +650,358 @@ rst_types = (
 
 all_input_dirs = [matlab_dir, example_dir, test_dir]
 
-all_fns = sum([glob.glob(join(d, "*.m")) for d in all_input_dirs], [])
-all_fns.sort()
 
-for output in ("hdr", "skl", None):
-    infix = "" if output is None else "_" + output
-    for rst_type in rst_types:
-        fns = rst_type.matching(output, all_fns)
-        if not len(fns):
-            continue
+def get_all_fns():
+    all_fns = sum([glob.glob(join(d, "*.m")) for d in all_input_dirs], [])
+    all_fns.sort()
+    return all_fns
 
-        base_names = []
-        rebuild_toc = False
 
-        print(("matlab2rst %s %s: " % (rst_type.prefix, output or "")), end=" ")
-        for fn in fns:
-            [p, b] = base_name(fn)
+def write_toc(rst_type, output, toc_base_name, base_names):
+    ref_header = ".. _`%s`:\n" % toc_base_name
 
-            b += infix
+    title_text = rst_type.get_title(output)
+    title_line = "=" * len(title_text)
+    title = "\n".join([title_line, title_text, title_line])
 
-            # make a text file that can be 'included' in sphinx
-            trg_fn = join(output_mat_abs, "%s.txt" % b)
+    toctree_header = ".. toctree::\n" "    :maxdepth: 2\n" "    :hidden:\n"
 
-            with open(fn) as f:
-                mat = f.read()
+    toctree_body = "\n".join("    %s/%s" % (output_mat_rel, b) for b, _ in base_names)
+    header = "\n".join([ref_header, title, "", toctree_header, toctree_body, "", ""])
 
-            parts = matlab2parts(mat)
+    trg_fn = join(output_root_abs, "%s.rst" % toc_base_name)
+    write_if_changed(trg_fn, header + modules.as_table(base_names))
 
-            remake_rst = False
-            if is_newer(fn, trg_fn):
-                remake_rst = True
-                rst = matlab2rst(mat, output)
 
-                with open(trg_fn, "w") as f:
-                    f.write(rst)
+class TOCModel(object):
+    """base names and summary lines of the files in each TOC, stored
+    between runs, so that TOCs are only written when these change"""
 
-            if rst_type.needs_pb(output):
-                pb_path = join(output_root_abs, publish_rel)
-                pb_fn = join(pb_path, b + ".html")
-                if is_newer(fn, pb_fn):
-                    remake_rst = True
-                include_pb = ":%s_up: %s \n\n" % (rst_type.prefix, b)
-            else:
-                include_pb = ""
-
-            # print progress
-            sys.stdout.write("." if remake_rst else "s")
-            # make the rst file that includes it
-            trg_fn = join(output_mat_abs, "%s.rst" % b)
-            if remake_rst or is_newer(fn, trg_fn):
-                label = b.replace("_", " ")
-                header = ".. _%s:\n\n%s\n%s\n\n%s" % (
-                    b,
-                    label,
-                    "=" * len(b),
-                    include_pb,
-                )
-                body = ".. include :: %s\n\n" % ("%s.txt" % b)
+    def __init__(self, fn, version):
+        self.fn = fn
+        self.version = version
+        # mapping from TOC base name to dict with keys 'page_size',
+        # 'base_names' and 'files' (the files written for the TOC)
+        self.tocs = dict()
+
+        if isfile(fn):
+            try:
+                with open(fn) as f:
+                    stored = json.load(f)
+            except ValueError:
+                stored = dict()
+
+            if stored.get("version") == version:
+                self.tocs = stored["tocs"]
+
+    @staticmethod
+    def as_entry(base_names, page_size):
+        return dict(base_names=[list(b) for b in base_names], page_size=page_size)
+
+    def is_current(self, toc_base_name, base_names, page_size):
+        """True if the TOC was written for these base names, and the
+        files written for it still exist"""
+        toc = self.tocs.get(toc_base_name)
+        if toc is None:
+            return False
+
+        toc_entry = self.as_entry(base_names, page_size)
+        return all(toc[k] == v for k, v in toc_entry.items()) and all(
+            isfile(join(output_root_abs, fn)) for fn in toc["files"]
+        )
+
+    def update(self, toc_base_name, base_names, page_size, toc_fns):
+        toc = self.as_entry(base_names, page_size)
+        toc["files"] = list(toc_fns)
+        self.tocs[toc_base_name] = toc
+
+    def save(self):
+        content = json.dumps(
+            dict(version=self.version, tocs=self.tocs), indent=1, sort_keys=True
+        )
+        write_if_changed(self.fn, content)
+
+
+def get_full_include_pages(rst_type, base_names, page_size):
+    """returns a list of tuples (page_name, base_names) with the pages
+    with full listings. If there are multiple pages, the first one is an
+    index of the other pages and has no listings itself"""
+    name = "contents%s" % rst_type.get_postfix()
+    if page_size <= 0 or len(base_names) <= page_size:
+        return [(name, base_names)]
+
+    pages = [(name, [])]
+    for i, start in enumerate(range(0, len(base_names), page_size)):
+        pages.append(("%s_%d" % (name, i + 1), base_names[start : start + page_size]))
+
+    return pages
+
+
+def write_if_changed(fn, content):
+    """write content to fn unless it already has that content, so that
+    Sphinx does not consider unchanged pages as outdated"""
+    if isfile(fn):
+        with open(fn, encoding="utf-8", errors="replace", newline="") as f:
+            if f.read() == canonical(content):
+                return False
+
+    write_file(fn, content)
+    return True
+
+
+def full_listings(base_names, with_labels):
+    return "\n".join(
+        [
+            "%s%s\n%s\n\n :demo: %s\n\n.. include:: %s\n\n\n"
+            % (
+                ".. _`full_%s`:\n\n" % b if with_labels else "",
+                b,
+                "+" * len(b),
+                b,
+                join(output_mat_rel, b) + ".txt",
+            )
+            for b, _ in base_names
+        ]
+    )
 
-                with open(trg_fn, "w") as f:
-                    f.write(header + body)
 
-                rebuild_toc = True
+def write_full_include(rst_type, base_names, page_size=0):
+    """write the page(s) with full listings; with page_size > 0, listings
+    are divided over pages with at most page_size listings each.
+    Returns the names of the files written"""
+    pages = get_full_include_pages(rst_type, base_names, page_size)
 
-            base_names.append((b, parts[1]))
-        if rebuild_toc:
-            toc_base_name = "matindex%s%s" % (infix, rst_type.get_postfix())
-            ref_header = ".. _`%s`:\n" % toc_base_name
+    title = "%s - full listings" % (rst_type.get_name())
+    local_contents = ".. contents::\n    :local:\n    :depth: 1\n\n"
 
-            title_text = rst_type.get_title(output)
-            title_line = "=" * len(title_text)
-            title = "\n".join([title_line, title_text, title_line])
+    index_name = pages[0][0]
+    index_header = ".. _`%s.rst`:\n\n%s\n%s\n\n" % (
+        index_name,
+        title,
+        "=" * len(title),
+    )
 
-            toctree_header = ".. toctree::\n" "    :maxdepth: 2\n" "    :hidden:\n"
+    if len(pages) == 1:
+        contents = {index_name: index_header + local_contents}
+        contents[index_name] += full_listings(base_names, False) + "\n\n"
+    else:
+        n_pages = len(pages) - 1
+        toctree = ".. toctree::\n    :hidden:\n\n%s\n\n" % "\n".join(
+            "    %s" % page_name for page_name, _ in pages[1:]
+        )
 
-            toctree_body = "\n".join(
-                "    %s/%s" % (output_mat_rel, b) for b, _ in base_names
+        index_body = []
+        contents = dict()
+        for i, (page_name, page_base_names) in enumerate(pages[1:]):
+            page_title = "%s (%d of %d)" % (title, i + 1, n_pages)
+            contents[page_name] = "".join(
+                [
+                    ".. _`%s.rst`:\n\n%s\n%s\n\n"
+                    % (
+                        page_name,
+                        page_title,
+                        "=" * len(page_title),
+                    ),
+                    local_contents,
+                    full_listings(page_base_names, True),
+                    "\n\n",
+                ]
             )
-            header = "\n".join(
-                [ref_header, title, "", toctree_header, toctree_body, "", ""]
+
+            index_body.append(
+                ":doc:`Page %d <%s>`\n\n%s\n"
+                % (
+                    i + 1,
+                    page_name,
+                    "\n".join(
+                        "- :ref:`%s <full_%s>`" % (b, b) for b, _ in page_base_names
+                    ),
+                )
             )
 
-            trg_fn = join(output_root_abs, "%s.rst" % toc_base_name)
-            with open(trg_fn, "w") as f:
-                f.write(header)
-                f.write(modules.as_table(base_names))
-
-            if rst_type.needs_full_include():
-                include_base_name = "contents%s.rst" % rst_type.get_postfix()
-                trg_fn = join(output_root_abs, include_base_name)
-
-                title = "%s - full listings" % (rst_type.get_name())
-                header = (
-                    ".. _`%s`:\n\n%s\n%s\n\n.. "
-                    "contents::\n    :local:\n    :depth: 1\n\n"
-                ) % (include_base_name, title, "=" * len(title))
-
-                body = "\n".join(
-                    [
-                        "%s\n%s\n\n :demo: %s\n\n.. include:: %s\n\n\n"
-                        % (b, "+" * len(b), b, join(output_mat_rel, b) + ".txt")
-                        for b, _ in base_names
-                    ]
+        contents[index_name] = index_header + toctree + "\n".join(index_body) + "\n"
+
+    page_fns = []
+    for page_name, _ in pages:
+        page_fn = "%s.rst" % page_name
+        write_if_changed(join(output_root_abs, page_fn), contents[page_name])
+        page_fns.append(page_fn)
+
+    remove_extra_pages(rst_type, page_fns)
+    return page_fns
+
+
+def remove_extra_pages(rst_type, page_fns):
+    """remove pages with full listings left over from a previous build
+    with more pages"""
+    index_name = "contents%s" % rst_type.get_postfix()
+    for fn in glob.glob(join(output_root_abs, "%s_*.rst" % index_name)):
+        if basename(fn) not in page_fns:
+            os.remove(fn)
+
+
+def get_include_pb(rst_type, output, b):
+    """role linking to the published output of b, if any"""
+    if rst_type.needs_pb(output):
+        return ":%s_up: %s \n\n" % (rst_type.prefix, b)
+    return ""
+
+
+def render(fn, rst_type, output, mat, force=False, cache=None, version=None):
+    """write the .txt and .rst file for output type output of fn with
+    contents mat (a MatlabFile), unless they are newer than fn (and force is False).
+    Returns a tuple (base name, progress character), where the progress
+    character is 's' (skipped), 'c' (restored from cache) or '.' (rendered)"""
+    [p, b] = base_name(fn)
+    b += "" if output is None else "_" + output
+
+    # make a text file that can be 'included' in sphinx,
+    # and the rst file that includes it
+    txt_fn = join(output_mat_abs, "%s.txt" % b)
+    trg_fn = join(output_mat_abs, "%s.rst" % b)
+
+    remake_rst = force or is_newer(fn, txt_fn) or is_newer(fn, trg_fn)
+
+    if rst_type.needs_pb(output):
+        pb_fn = join(output_root_abs, publish_rel, b + ".html")
+        if is_newer(fn, pb_fn):
+            remake_rst = True
+
+    include_pb = get_include_pb(rst_type, output, b)
+
+    cache_key = BuildCache.key("matlab2rst", version, output, b, mat.data, include_pb)
+
+    if not remake_rst:
+        return b, "s"
+
+    if cache is not None and cache.restore(cache_key, output_mat_abs):
+        return b, "c"
+
+    write_file(txt_fn, mat.to_rst(output))
+
+    label = b.replace("_", " ")
+    header = ".. _%s:\n\n%s\n%s\n\n%s" % (
+        b,
+        label,
+        "=" * len(b),
+        include_pb,
+    )
+    body = ".. include :: %s\n\n" % ("%s.txt" % b)
+    write_file(trg_fn, header + body)
+
+    if cache is not None:
+        cache.store(
+            cache_key,
+            output_mat_abs,
+            [basename(txt_fn), basename(trg_fn)],
+        )
+
+    return b, "."
+
+
+def get_toc_base_name(rst_type, output):
+    infix = "" if output is None else "_" + output
+    return "matindex%s%s" % (infix, rst_type.get_postfix())
+
+
+def get_toc_fns(rst_type, output, base_names, page_size):
+    """names of the files written by write_tocs"""
+    toc_fns = ["%s.rst" % get_toc_base_name(rst_type, output)]
+    if rst_type.needs_full_include():
+        pages = get_full_include_pages(rst_type, base_names, page_size)
+        toc_fns.extend("%s.rst" % page_name for page_name, _ in pages)
+
+    return toc_fns
+
+
+def write_tocs(rst_type, output, base_names, page_size):
+    """write the TOC, and the full listings if needed; returns the names
+    of the files written"""
+    toc_base_name = get_toc_base_name(rst_type, output)
+    toc_fns = ["%s.rst" % toc_base_name]
+
+    write_toc(rst_type, output, toc_base_name, base_names)
+    if rst_type.needs_full_include():
+        toc_fns.extend(write_full_include(rst_type, base_names, page_size))
+
+    return toc_fns
+
+
+def main(page_size=full_listing_page_size):
+    for d in (output_root_abs, output_index_abs, output_mat_abs):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    all_fns = get_all_fns()
+
+    cache = BuildCache.from_env()
+    version = tool_version(__file__)
+    toc_model = TOCModel(toc_model_fn, version)
+
+    for output in ("hdr", "skl", None):
+        for rst_type in rst_types:
+            fns = rst_type.matching(output, all_fns)
+            if not len(fns):
+                continue
+
+            base_names = []
+
+            print(("matlab2rst %s %s: " % (rst_type.prefix, output or "")), end=" ")
+            for fn in fns:
+                mat = MatlabFile.from_file(fn)
+
+                b, progress = render(fn, rst_type, output, mat, False, cache, version)
+
+                # print progress
+                sys.stdout.write(progress)
+
+                base_names.append((b, mat.summary()))
+
+            # the TOC only changes if files were added or removed, or their
+            # summary line changed
+            toc_base_name = get_toc_base_name(rst_type, output)
+            if not toc_model.is_current(toc_base_name, base_names, page_size):
+                toc_key = BuildCache.key(
+                    "matlab2rst-toc",
+                    version,
+                    output,
+                    rst_type.prefix,
+                    base_names,
+                    page_size,
                 )
+                toc_fns = get_toc_fns(rst_type, output, base_names, page_size)
+                if cache is not None and cache.restore(toc_key, output_root_abs):
+                    if rst_type.needs_full_include():
+                        remove_extra_pages(rst_type, toc_fns)
+                else:
+                    toc_fns = write_tocs(rst_type, output, base_names, page_size)
 
-                with open(trg_fn, "w") as f:
-                    f.write(header + body + "\n\n")
+                    if cache is not None:
+                        cache.store(toc_key, output_root_abs, toc_fns)
+
+                toc_model.update(toc_base_name, base_names, page_size, toc_fns)
+                sys.stdout.write("<TOC>")
+
+            print()
+
+    toc_model.save()
+
+    if cache is not None:
+        cache.close()
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="convert matlab files to rst")
+    parser.add_argument(
+        "--page_size",
+        type=int,
+        default=full_listing_page_size,
+        help="maximum number of full listings (of demos) per page, "
+        "or 0 to put all listings on a single page",
+    )
+    return parser
 
-            sys.stdout.write("<TOC>")
 
-        print()
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+    main(page_size=args.page_size)
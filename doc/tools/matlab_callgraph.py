@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# builds a static call graph of the .m files in mvpa/, tests/ and examples/
+#
+# Each file is tokenized (ignoring comments and the help text), and every
+# identifier that is the name of a function in mvpa/ counts as a call.
+# Function names in strings (e.g. for feval) are also counted. Tokens are
+# cached per file, keyed by the hash of the file contents.
+#
+# The main use is change-impact test selection: given the files changed
+# since a git revision, it lists the unit tests in tests/ that
+# (transitively) call any of the changed functions:
+#
+#   matlab_callgraph.py --affected_tests origin/master
+#
+# which prints test file names that can be passed to run_tests_parallel.py.
+# Changes that cannot be attributed to specific functions select all tests;
+# these are changes to files other than the .m files directly in mvpa/ and
+# tests/ (except for files in examples/), and removed files.
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from os.path import join, split, relpath, isfile
+
+from matlab2rst import matlab2parts, matlab_dir, test_dir, get_all_fns
+
+root_dir = os.path.abspath(join(matlab_dir, os.pardir))
+default_cache_fn = join(root_dir, ".cosmo_callgraph_cache.json")
+
+# increase when tokenization changes, to invalidate existing caches
+cache_version = 1
+
+identifier_pattern = re.compile(r"[A-Za-z_]\w*")
+function_in_string_pattern = re.compile(r"\bcosmo_\w+")
+
+keywords = set("""break case catch classdef continue else elseif end for function
+    global if otherwise parfor persistent return spmd switch try while""".split())
+
+# characters after which a quote is a transpose operator, not a string
+transpose_preceders = set(")]}.'_") | set(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+)
+
+
+def tokenize_line(line):
+    """returns the identifiers in a line of code, and names of cosmo_*
+    functions in strings. Comments are ignored"""
+    tokens = []
+    code = []
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c == "%" or line.startswith("...", i):
+            break
+
+        if c == '"' or (c == "'" and not (code and code[-1] in transpose_preceders)):
+            # string literal; a doubled quote is an escaped quote
+            j = i + 1
+            while j < n:
+                if line[j] == c:
+                    if j + 1 < n and line[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+
+            tokens.extend(function_in_string_pattern.findall(line[i + 1 : j]))
+            code.append(" ")
+            i = j + 1
+            continue
+
+        if not c.isspace():
+            code.append(c)
+        elif code and code[-1] != " ":
+            code.append(" ")
+        i += 1
+
+    tokens.extend(identifier_pattern.findall("".join(code)))
+    return tokens
+
+
+def tokenize(data):
+    """returns the sorted unique identifiers used in the code of a .m file"""
+    signature, _, _, body = matlab2parts(data)
+
+    if signature:
+        # the help text (the second and third part) has no code
+        lines = [signature] + body.split("\n")
+    else:
+        # script: matlab2parts does not separate comments from code
+        lines = data.split("\n")
+
+    tokens = set()
+    in_block_comment = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped == "%{":
+            in_block_comment = True
+        elif stripped == "%}":
+            in_block_comment = False
+        elif not in_block_comment:
+            tokens.update(tokenize_line(line))
+
+    return sorted(tokens - keywords)
+
+
+def file_hash(data):
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def function_name(fn):
+    return split(fn)[1][:-2]
+
+
+class CallGraph(object):
+    def __init__(self, name2tokens, name2fn):
+        self.name2fn = name2fn
+        self.functions = set(
+            name for name, fn in name2fn.items() if split(fn)[0] == matlab_dir
+        )
+
+        self.callees = dict()
+        self.callers = dict((name, set()) for name in name2fn)
+        for name, tokens in name2tokens.items():
+            callees = set(t for t in tokens if t in self.functions and t != name)
+            self.callees[name] = callees
+            for callee in callees:
+                self.callers[callee].add(name)
+
+    @classmethod
+    def from_files(cls, fns=None, cache_fn=default_cache_fn):
+        """build the call graph, re-tokenizing only files that changed
+        since the cache was written"""
+        if fns is None:
+            fns = get_all_fns()
+
+        cache = dict()
+        if cache_fn is not None and isfile(cache_fn):
+            with open(cache_fn) as f:
+                content = json.load(f)
+            if content.get("version") == cache_version:
+                cache = content["files"]
+
+        new_cache = dict()
+        name2tokens = dict()
+        name2fn = dict()
+        for fn in fns:
+            with open(fn) as f:
+                data = f.read()
+
+            key = relpath(fn, root_dir)
+            h = file_hash(data)
+            if key in cache and cache[key]["hash"] == h:
+                entry = cache[key]
+            else:
+                entry = dict(hash=h, tokens=tokenize(data))
+
+            new_cache[key] = entry
+            name = function_name(fn)
+            name2tokens[name] = entry["tokens"]
+            name2fn[name] = fn
+
+        if cache_fn is not None and new_cache != cache:
+            with open(cache_fn, "w") as f:
+                json.dump(dict(version=cache_version, files=new_cache), f)
+
+        return cls(name2tokens, name2fn)
+
+    def transitive_callers(self, names):
+        """all functions, tests and examples that call any of the names,
+        directly or indirectly, including the names themselves"""
+        visited = set()
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name in visited:
+                continue
+            visited.add(name)
+            todo.extend(self.callers.get(name, ()))
+
+        return visited
+
+    def transitive_callees(self, name):
+        """all functions in mvpa/ called directly or indirectly by name"""
+        visited = set()
+        todo = list(self.callees.get(name, ()))
+        while todo:
+            callee = todo.pop()
+            if callee in visited:
+                continue
+            visited.add(callee)
+            todo.extend(self.callees.get(callee, ()))
+
+        return visited
+
+    def tests(self):
+        return sorted(
+            name
+            for name, fn in self.name2fn.items()
+            if split(fn)[0] == test_dir and name.startswith("test_")
+        )
+
+    def affected_tests(self, changed_fns):
+        """returns the names of the unit tests affected by changes in
+        changed_fns (paths relative to the root directory), or None if
+        all tests should be run"""
+        changed_names = set()
+        for fn in changed_fns:
+            if fn.split("/")[0] == "examples":
+                continue  # examples are not used by unit tests
+
+            subdir, base_fn = split(fn)
+            if subdir not in ("mvpa", "tests") or not base_fn.endswith(".m"):
+                # e.g. external code or data
+                return None
+
+            name = function_name(base_fn)
+            if name not in self.name2fn:
+                # removed, so its callers are not known anymore
+                return None
+
+            changed_names.add(name)
+
+        if "cosmo_run_tests" in changed_names:
+            return None
+
+        affected = self.transitive_callers(changed_names)
+        return sorted(
+            name
+            for name in affected
+            if name.startswith("test_") and name in self.name2fn
+        )
+
+
+def get_changed_files(ref):
+    """files changed in the working tree relative to ref, including
+    untracked files"""
+    cmds = [
+        ["git", "diff", "--name-only", ref, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ]
+    changed = set()
+    for cmd in cmds:
+        output = subprocess.check_output(cmd, cwd=root_dir).decode("UTF-8")
+        changed.update(line for line in output.split("\n") if line)
+
+    return sorted(changed)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="static call graph of CoSMoMVPA .m files"
+    )
+    parser.add_argument(
+        "--affected_tests",
+        metavar="REF",
+        help="print the unit tests affected by changes since git revision REF",
+    )
+    parser.add_argument(
+        "--changed",
+        nargs="*",
+        default=[],
+        help="changed files (relative to the root directory), used instead "
+        "of, or in addition to, the changes since REF",
+    )
+    parser.add_argument(
+        "--callees",
+        metavar="NAME",
+        help="print the mvpa/ functions called (transitively) by NAME",
+    )
+    parser.add_argument("--cache", default=default_cache_fn)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    graph = CallGraph.from_files(cache_fn=args.cache)
+
+    if args.callees is not None:
+        print("\n".join(sorted(graph.transitive_callees(args.callees))))
+
+    if args.affected_tests is not None or args.changed:
+        changed = list(args.changed)
+        if args.affected_tests is not None:
+            changed += get_changed_files(args.affected_tests)
+
+        tests = graph.affected_tests(changed)
+        if tests is None:
+            sys.stderr.write("Changes affect all tests\n")
+            tests = graph.tests()
+
+        print("\n".join("%s.m" % name for name in tests))
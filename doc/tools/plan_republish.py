@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# determines which examples/run_*.m and demo_*.m scripts must be
+# re-published in source/_static/publish
+#
+# Each script is summarized by a hash of its contents together with the
+# hashes of all cosmo_* functions it calls (directly or indirectly,
+# according to matlab_callgraph). Whitespace is ignored, and so are
+# comments in the functions (but not in the script, as these end up in
+# the published output). A script needs re-publication if its output is
+# missing, or if its summary differs from the one recorded when it was
+# last published.
+#
+# Usage:
+#   plan_republish.py [--output plan.txt]    list scripts to publish
+#   plan_republish.py --record run_foo ...   record scripts as published
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from os.path import join, isfile, getmtime, relpath
+
+from matlab2rst import example_dir, output_root_abs, publish_rel
+from matlab_callgraph import CallGraph, root_dir
+
+publish_dir = join(output_root_abs, publish_rel)
+default_manifest_fn = join(publish_dir, ".publish_manifest.json")
+
+# increase when normalization changes, to invalidate existing manifests
+manifest_version = 1
+
+
+def normalized_hash(data, keep_comments=True):
+    """hash of the contents, ignoring whitespace and (optionally)
+    comment lines"""
+    lines = []
+    for line in data.split("\n"):
+        s = " ".join(line.split())
+        if not s or (not keep_comments and s.startswith("%")):
+            continue
+        lines.append(s)
+
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def read(fn):
+    with open(fn) as f:
+        return f.read()
+
+
+class ExampleState(object):
+    def __init__(self, name, script_hash, function_hashes):
+        self.name = name
+        self.script_hash = script_hash
+        self.function_hashes = function_hashes
+
+    @property
+    def digest(self):
+        parts = [self.script_hash] + [
+            "%s:%s" % item for item in sorted(self.function_hashes.items())
+        ]
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def as_dict(self):
+        return dict(
+            digest=self.digest,
+            script=self.script_hash,
+            functions=self.function_hashes,
+        )
+
+    def changes(self, recorded):
+        """reasons why this state differs from a recorded one"""
+        if recorded.get("digest") == self.digest:
+            return []
+
+        reasons = []
+        if recorded.get("script") != self.script_hash:
+            reasons.append("script changed")
+
+        recorded_functions = recorded.get("functions", dict())
+        for name in sorted(set(recorded_functions) | set(self.function_hashes)):
+            if recorded_functions.get(name) != self.function_hashes.get(name):
+                reasons.append("%s changed" % name)
+
+        return reasons
+
+
+class RepublishPlanner(object):
+    def __init__(self, manifest_fn=default_manifest_fn):
+        self.manifest_fn = manifest_fn
+        self.graph = CallGraph.from_files()
+
+        self.recorded = dict()
+        if isfile(manifest_fn):
+            with open(manifest_fn) as f:
+                content = json.load(f)
+            if content.get("version") == manifest_version:
+                self.recorded = content["examples"]
+
+        self.function_hashes = dict()
+
+    def examples(self):
+        return sorted(
+            name
+            for name, fn in self.graph.name2fn.items()
+            if fn.startswith(example_dir) and name.split("_")[0] in ("run", "demo")
+        )
+
+    def function_hash(self, name):
+        if name not in self.function_hashes:
+            data = read(self.graph.name2fn[name])
+            self.function_hashes[name] = normalized_hash(data, keep_comments=False)
+
+        return self.function_hashes[name]
+
+    def state(self, name):
+        script_hash = normalized_hash(read(self.graph.name2fn[name]))
+        function_hashes = dict(
+            (callee, self.function_hash(callee))
+            for callee in self.graph.transitive_callees(name)
+        )
+        return ExampleState(name, script_hash, function_hashes)
+
+    def reasons(self, name):
+        """reasons to re-publish an example; empty if it is up to date"""
+        output_fn = join(publish_dir, name + ".html")
+        if not isfile(output_fn):
+            return ["output missing"]
+
+        if name not in self.recorded:
+            # never planned before: fall back to modification times
+            if getmtime(self.graph.name2fn[name]) > getmtime(output_fn):
+                return ["output older than script"]
+            return []
+
+        return self.state(name).changes(self.recorded[name])
+
+    def plan(self):
+        """returns a list of tuples (name, reasons) of examples to publish"""
+        plan = []
+        for name in self.examples():
+            reasons = self.reasons(name)
+            if reasons:
+                plan.append((name, reasons))
+
+        return plan
+
+    def record(self, names):
+        """store the current state of examples that were published"""
+        for name in names:
+            self.recorded[name] = self.state(name).as_dict()
+
+        content = dict(version=manifest_version, examples=self.recorded)
+        tmp_fn = self.manifest_fn + ".tmp"
+        with open(tmp_fn, "w") as f:
+            json.dump(content, f, indent=1, sort_keys=True)
+        os.replace(tmp_fn, self.manifest_fn)
+
+    def script_fn(self, name):
+        return relpath(self.graph.name2fn[name], root_dir)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="list example scripts that need to be re-published"
+    )
+    parser.add_argument(
+        "--output", help="write the scripts to publish to this file, one per line"
+    )
+    parser.add_argument(
+        "--record",
+        nargs="*",
+        metavar="NAME",
+        help="record the given examples as published",
+    )
+    parser.add_argument(
+        "--record_all",
+        action="store_true",
+        help="record all examples with existing output as published",
+    )
+    parser.add_argument("--manifest", default=default_manifest_fn)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    planner = RepublishPlanner(args.manifest)
+
+    if args.record_all or args.record:
+        if args.record_all:
+            names = [
+                name
+                for name in planner.examples()
+                if isfile(join(publish_dir, name + ".html"))
+            ]
+        else:
+            names = [os.path.splitext(os.path.basename(n))[0] for n in args.record]
+
+        planner.record(names)
+        print("Recorded %d examples as published" % len(names))
+        sys.exit(0)
+
+    plan = planner.plan()
+    for name, reasons in plan:
+        sys.stderr.write("%s: %s\n" % (name, ", ".join(reasons)))
+
+    script_fns = [planner.script_fn(name) for name, _ in plan]
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("".join("%s\n" % fn for fn in script_fns))
+    else:
+        print("\n".join(script_fns))
+
+    sys.stderr.write(
+        "%d of %d examples need publishing\n" % (len(plan), len(planner.examples()))
+    )
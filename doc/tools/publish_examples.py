@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# publishes examples/run_*.m and demo_*.m scripts in parallel, using a
+# pool of headless GNU Octave (or Matlab) processes.
+#
+# Each script is published by cosmo_publish_run_scripts in its own
+# staging directory (inside source/_static/publish, so that results can
+# be moved atomically) with its own temporary directory. When publishing
+# succeeds, images and then the html file are moved into
+# source/_static/publish, where build_demo_images.py and the :run_up: and
+# :demo_up: links generated by matlab2rst.py pick them up.
+#
+# By default the scripts reported by plan_republish.py are published. To
+# try this without Octave, use '--interpreter stand-in', which writes a
+# placeholder html and image file for each script.
+
+import os
+import re
+import sys
+import time
+import shlex
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, abspath, basename, splitext, isfile, isdir
+
+from matlab2rst import matlab_dir, example_dir
+from plan_republish import RepublishPlanner, publish_dir
+
+default_interpreter = "octave --no-gui --quiet --eval"
+stand_in = "stand-in"
+
+staging_root = join(publish_dir, ".staging")
+
+worker_code_template = """
+cd('%(mvpa_dir)s');
+cosmo_set_path();
+is_ok=cosmo_publish_run_scripts('%(script_fn)s','-force','-o','%(output_dir)s');
+exit(~is_ok);
+"""
+
+
+def quote(s):
+    return s.replace("'", "''")
+
+
+def get_worker_command(interpreter, script_fn, output_dir):
+    code = worker_code_template % dict(
+        mvpa_dir=quote(abspath(matlab_dir)),
+        script_fn=quote(abspath(script_fn)),
+        output_dir=quote(output_dir),
+    )
+
+    if interpreter == stand_in:
+        prefix = [sys.executable, abspath(__file__), "--run_stand_in"]
+    else:
+        prefix = shlex.split(interpreter)
+
+    return prefix + [code]
+
+
+def run_stand_in(code):
+    """pretends to be the interpreter: writes placeholder output"""
+    quoted = re.findall(r"'([^']*)'", code)
+    script_fn, output_dir = quoted[1], quoted[-1]
+    name = splitext(basename(script_fn))[0]
+
+    with open(join(output_dir, name + ".html"), "w") as f:
+        f.write("<html><body>%s</body></html>\n" % name)
+    with open(join(output_dir, name + "_01.png"), "wb") as f:
+        f.write(b"")
+    with open(join(output_dir, "index.html"), "w") as f:
+        f.write("<html></html>\n")
+
+
+def is_output_of(name, fn):
+    """True if fn is the html or an image published for script name"""
+    pat = r"^%s(\.html|_\d+\.png|-\d+\.(png|jpg)|\d+\.png)$" % re.escape(name)
+    return re.match(pat, fn) is not None
+
+
+class PublishJob(object):
+    def __init__(self, name, interpreter):
+        self.name = name
+        self.interpreter = interpreter
+        self.script_fn = join(example_dir, name + ".m")
+        self.output_dir = join(staging_root, name)
+        self.tmp_dir = join(staging_root, name + ".tmp")
+        self.log_fn = join(staging_root, name + ".log")
+        self.returncode = None
+        self.seconds = None
+
+    @property
+    def is_ok(self):
+        return self.returncode == 0 and isfile(
+            join(self.output_dir, self.name + ".html")
+        )
+
+    def run(self):
+        for d in (self.output_dir, self.tmp_dir):
+            if isdir(d):
+                shutil.rmtree(d)
+            os.makedirs(d)
+
+        env = dict(os.environ, TMPDIR=self.tmp_dir, TMP=self.tmp_dir)
+        cmd = get_worker_command(self.interpreter, self.script_fn, self.output_dir)
+
+        start_time = time.time()
+        with open(self.log_fn, "w") as log_file:
+            self.returncode = subprocess.call(
+                cmd,
+                cwd=self.tmp_dir,
+                env=env,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+        self.seconds = time.time() - start_time
+
+        shutil.rmtree(self.tmp_dir)
+        return self
+
+    def install(self):
+        """move the output into the publish directory: first the images,
+        then the html file, replacing each file atomically. Images from a
+        previous version of the output that are not present anymore are
+        removed afterwards"""
+        new_fns = [
+            fn for fn in os.listdir(self.output_dir) if is_output_of(self.name, fn)
+        ]
+        html_fn = self.name + ".html"
+        new_fns.sort(key=lambda fn: fn == html_fn)
+
+        for fn in new_fns:
+            os.replace(join(self.output_dir, fn), join(publish_dir, fn))
+
+        for fn in os.listdir(publish_dir):
+            if is_output_of(self.name, fn) and fn not in new_fns:
+                os.remove(join(publish_dir, fn))
+
+        self.cleanup()
+
+    def cleanup(self):
+        shutil.rmtree(self.output_dir)
+        os.remove(self.log_fn)
+
+
+def write_index(fn=None):
+    """index of published outputs, as written by cosmo_publish_run_scripts"""
+    if fn is None:
+        fn = join(publish_dir, "index.html")
+
+    lines = [
+        '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01//EN">',
+        "<HTML><HEAD><TITLE>Index of matlab outputs</TITLE></HEAD>",
+        "<BODY>Matlab output<UL>",
+    ]
+    for script_fn in sorted(os.listdir(example_dir)):
+        if not script_fn.endswith(".m"):
+            continue
+        output_fn = script_fn[:-2] + ".html"
+        if isfile(join(publish_dir, output_fn)):
+            lines.append('<LI><A HREF="%s">%s</A></LI>' % (output_fn, script_fn[:-2]))
+    lines.append('</UL>Back to <A HREF="../../index.html">index</A>.</BODY></HTML>')
+
+    with open(fn, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def get_names(args, planner):
+    if args.scripts:
+        return [splitext(basename(s))[0] for s in args.scripts]
+
+    if args.plan:
+        with open(args.plan) as f:
+            return [splitext(basename(line.strip()))[0] for line in f if line.strip()]
+
+    if args.all:
+        return planner.examples()
+
+    return [name for name, _ in planner.plan()]
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="publish example scripts in parallel")
+    parser.add_argument(
+        "scripts",
+        nargs="*",
+        help="scripts to publish (default: those reported by plan_republish.py)",
+    )
+    parser.add_argument("--plan", help="file with scripts to publish, one per line")
+    parser.add_argument(
+        "--all", action="store_true", help="publish all run_* and demo_* scripts"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=4, help="number of parallel processes"
+    )
+    parser.add_argument(
+        "--interpreter",
+        default=default_interpreter,
+        help="command that evaluates Matlab code given as its last "
+        "argument, or '%s' to test without Octave" % stand_in,
+    )
+    parser.add_argument(
+        "--no_record",
+        action="store_true",
+        help="do not record published scripts in the publish manifest",
+    )
+    parser.add_argument("--run_stand_in", help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    if args.run_stand_in is not None:
+        run_stand_in(args.run_stand_in)
+        sys.exit(0)
+
+    planner = RepublishPlanner()
+    names = get_names(args, planner)
+    if not names:
+        print("Nothing to publish")
+        sys.exit(0)
+
+    if not isdir(staging_root):
+        os.makedirs(staging_root)
+
+    print("Publishing %d scripts using %d processes" % (len(names), args.jobs))
+    jobs = [PublishJob(name, args.interpreter) for name in names]
+
+    published = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        for job in executor.map(PublishJob.run, jobs):
+            if job.is_ok:
+                job.install()
+                published.append(job.name)
+                print("published %s (%.1f sec)" % (job.name, job.seconds))
+            else:
+                failed.append(job.name)
+                print(
+                    "!! failed %s (%.1f sec), see %s"
+                    % (job.name, job.seconds, job.log_fn)
+                )
+
+    write_index()
+
+    if published and not args.no_record:
+        planner.record(published)
+
+    if not failed:
+        shutil.rmtree(staging_root)
+
+    print("Published %d scripts, %d failed" % (len(published), len(failed)))
+    sys.exit(1 if failed else 0)
@@ -7,11 +7,14 @@
 import datetime
 import subprocess
 import os
+import glob
 import textwrap
 
+from build_cache import BuildCache, tool_version, write_file
+
 log_fn = "source/_static/git_log.txt"
 summary_fn = "source/_static/git_summary.txt"
-git_since = "last month"
+git_since_days = 30
 
 tag2full = dict(
     RF="refactorings",
@@ -34,39 +37,35 @@ tag2full = dict(
 show_tags = ["BIG", "BK", "BF", None]
 
 
-def build_git_log(log_fn=log_fn, since=git_since):
-    """rebuilds git log if it is out of date"""
-    if git_log_out_of_date(log_fn=log_fn):
-        cmd = 'git log --since="%s" --full-history --stat > %s' % (since, log_fn)
+def get_git_since(days=git_since_days):
+    """date (in ISO 8601 format) of days days before the last commit, so
+    that the log depends on the commits only, and not on the current date"""
+    cmd = ["git", "log", "-1", "--pretty=format:%cI"]
+    last_commit_str = subprocess.check_output(cmd).decode("UTF-8").strip()
+    last_commit = datetime.datetime.fromisoformat(last_commit_str)
 
-        print(
-            ("rebuilding git log file: commits were " "made since last update . . ."),
-            end=" ",
-        )
+    return (last_commit - datetime.timedelta(days=days)).isoformat()
 
-        subprocess.check_call(cmd, shell=True)
-        print(" done.")
-    else:
-        print("git log file is up-to-date")
 
+def build_git_log(log_fn=log_fn, since=None):
+    """rebuilds git log if it changed"""
+    if since is None:
+        since = get_git_since()
 
-def git_log_out_of_date(log_fn=log_fn):
-    """helper function: determine whether git log is out of date"""
-    if not os.path.isfile(log_fn):
-        return True
+    cmd = ["git", "log", "--since=%s" % since, "--full-history", "--stat"]
+    log = subprocess.check_output(cmd).decode("UTF-8")
 
-    cmd = 'git log -1 --pretty=format:"%ad" --date=local'
-    last_commit_str = subprocess.check_output(cmd, shell=True).decode("UTF-8")
-    last_commit = datetime.datetime.strptime(last_commit_str, "%c")
-
-    log_changed = datetime.datetime.fromtimestamp(os.path.getmtime(log_fn))
-
-    return log_changed < last_commit
+    if os.path.isfile(log_fn) and get_log_lines(log_fn) == log.split("\n"):
+        print("git log file is up-to-date")
+    else:
+        print("rebuilding git log file . . .", end=" ")
+        write_file(log_fn, log)
+        print(" done.")
 
 
 def get_log_lines(fn=log_fn):
     """read git log lines"""
-    with open(fn) as f:
+    with open(fn, encoding="utf-8") as f:
         return f.read().split("\n")
 
 
@@ -106,8 +105,7 @@ def get_ack(lines, tag="ACK"):
     if not acks:
         return None
 
-    sep = "\n - "
-    return element("Acknowledgements", acks, "\n  - ")
+    return element("Acknowledgements", sorted(acks), "\n  - ")
 
 
 def as_title(header, rep="^"):
@@ -138,6 +136,8 @@ def indent(string, count=4):
 
 
 class CommitFileChanged(object):
+    __slots__ = ("filename", "postfix")
+
     def __init__(self, filename, postfix):
         self.filename = filename
         self.postfix = postfix
@@ -298,26 +298,50 @@ class CommitLog(object):
 
 
 if __name__ == "__main__":
-    build_git_log()
+    git_since = get_git_since()
+    build_git_log(since=git_since)
     log_lines = get_log_lines()
     summary = get_summary(log_lines)
     ack = get_ack(log_lines)
 
-    print("Building git log summary . . .", end=" ")
-    with open(summary_fn, "w") as f:
-        f.write(as_title("Changes since %s" % git_since, "="))
-        f.write(".. contents::\n    :local:\n    :depth: 1\n\n")
+    # the summary links to .m files that exist, so these are inputs as well
+    cache = BuildCache.from_env()
+    cache_key = BuildCache.key(
+        "summarize_git_log",
+        tool_version(__file__),
+        git_since,
+        show_tags,
+        "\n".join(log_lines),
+        sorted(glob.glob(os.path.join("..", "*", "*.m"))),
+    )
 
-        f.write("\n%s\n" % summary)
+    print("Building git log summary . . .", end=" ")
+    if cache is not None and cache.restore(cache_key, os.path.dirname(summary_fn)):
+        print(" restored from cache.")
+    else:
+        parts = [
+            as_title("Changes since %s" % git_since[:10], "="),
+            ".. contents::\n    :local:\n    :depth: 1\n\n",
+            "\n%s\n" % summary,
+        ]
 
         if ack is not None:
-            f.write("%s\n" % ack)
-
-        c = CommitLog.from_lines(log_lines)
+            parts.append("%s\n" % ack)
 
         for tag in show_tags:
             header = "all changes" if tag is None else tag2full[tag]
             c = CommitLog.from_lines(log_lines)
-            f.write(element(header[0].upper() + header[1:], c.rst_str(tag)))
+            parts.append(element(header[0].upper() + header[1:], c.rst_str(tag)))
+
+        write_file(summary_fn, "".join(parts))
+        if cache is not None:
+            cache.store(
+                cache_key,
+                os.path.dirname(summary_fn),
+                [os.path.basename(summary_fn)],
+            )
+
+        print(" done.")
 
-    print(" done.")
+    if cache is not None:
+        cache.close()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# rebuilds the documentation incrementally while .m files are edited
+#
+# After an initial build, the .m files in mvpa/, examples/ and tests/, the
+# published output in source/_static/publish, and .git/HEAD are polled for
+# changes. The contents and summary line of each .m file are kept in
+# memory, so that when a file changes:
+#
+# - only the variants (full, header, skeleton) of that file are rendered
+#   again by matlab2rst
+# - the matindex TOC (and full listings) of its group are written again
+#   only if a file was added or removed, or its summary line changed
+# - the function search index is updated for functions in mvpa/
+# - the demo gallery is built again if published images changed, and the
+#   git summary if .git/HEAD changed
+#
+# after which Sphinx, which is kept loaded in this process, writes only the
+# pages of the files that changed (and pages that depend on them).
+#
+# Usage:
+#   watch_docs.py [-b html] [--interval 0.2]
+#
+# Stop with Ctrl-C. The output is in build/<builder>, as with 'make'.
+
+import os
+import sys
+import glob
+import time
+import argparse
+import subprocess
+from os.path import join, basename, isfile
+
+import matlab2rst
+from matlab2rst import (
+    rst_types,
+    MatlabFile,
+    render,
+    write_tocs,
+    get_toc_base_name,
+    TOCModel,
+    toc_model_fn,
+    get_all_fns,
+    doc_root_dir,
+    output_root_abs,
+    output_mat_abs,
+    output_mat_rel,
+    publish_rel,
+    full_listing_page_size,
+)
+from build_cache import tool_version
+import build_function_index
+from build_function_index import function_prefix, index_rel
+
+outputs = ("hdr", "skl", None)
+
+publish_abs = join(output_root_abs, publish_rel)
+git_head_fn = join(doc_root_dir, os.pardir, ".git", "HEAD")
+function_index_abs = join(output_root_abs, index_rel)
+
+
+def stat_key(fn):
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def snapshot(fns):
+    """mapping from filename to (size, modification time)"""
+    keys = dict((fn, stat_key(fn)) for fn in fns)
+    return dict((fn, key) for fn, key in keys.items() if key is not None)
+
+
+def changed_files(old, new):
+    return sorted(fn for fn in set(old) | set(new) if old.get(fn) != new.get(fn))
+
+
+class MatlabState(object):
+    """contents and summary lines of all .m files, and the TOC model with
+    the base names of each group of files (an RSTType and output)"""
+
+    def __init__(self, page_size=full_listing_page_size):
+        self.page_size = page_size
+        self.toc_model = TOCModel(toc_model_fn, tool_version(matlab2rst.__file__))
+        # mapping from filename to tuple (MatlabFile, summary line)
+        self.files = dict()
+
+    def read(self, fn):
+        mat = MatlabFile.from_file(fn)
+        self.files[fn] = (mat, mat.summary())
+
+    def groups(self):
+        for output in outputs:
+            for rst_type in rst_types:
+                if rst_type.has_type(output):
+                    yield rst_type, output
+
+    def base_names(self, rst_type, output):
+        fns = rst_type.matching(output, sorted(self.files))
+        infix = "" if output is None else "_" + output
+        return [(matlab2rst.base_name(fn)[1] + infix, self.files[fn][1]) for fn in fns]
+
+    def update(self, fns):
+        """update the state for changed files fns (which may have been
+        removed), and render their variants. Returns the names of the .rst
+        files written or removed, relative to the source directory"""
+        changed = []
+        for fn in fns:
+            if isfile(fn):
+                self.read(fn)
+            else:
+                self.files.pop(fn, None)
+
+            for rst_type, output in self.groups():
+                if not rst_type.matching(output, [fn]):
+                    continue
+
+                if fn in self.files:
+                    mat = self.files[fn][0]
+                    b, _ = render(fn, rst_type, output, mat, force=True)
+                else:
+                    b = matlab2rst.base_name(fn)[1]
+                    b += "" if output is None else "_" + output
+                    for ext in (".rst", ".txt"):
+                        if isfile(join(output_mat_abs, b + ext)):
+                            os.remove(join(output_mat_abs, b + ext))
+
+                changed.append("%s/%s.rst" % (output_mat_rel, b))
+
+        for rst_type, output in self.groups():
+            toc_base_name = get_toc_base_name(rst_type, output)
+            base_names = self.base_names(rst_type, output)
+            if not base_names and toc_base_name not in self.toc_model.tocs:
+                continue
+
+            if not self.toc_model.is_current(toc_base_name, base_names, self.page_size):
+                toc_fns = write_tocs(rst_type, output, base_names, self.page_size)
+                self.toc_model.update(
+                    toc_base_name, base_names, self.page_size, toc_fns
+                )
+                changed.extend(toc_fns)
+
+        self.toc_model.save()
+        return changed
+
+
+class Watcher(object):
+    def __init__(self, app, state, interval=0.2):
+        self.app = app
+        self.state = state
+        self.interval = interval
+
+        self.m_files = snapshot(get_all_fns())
+        self.publish_files = snapshot(self.publish_fns())
+        self.git_head = stat_key(git_head_fn)
+
+        # mapping from filename to function index entry, for mvpa/cosmo_*.m
+        self.function_entries = dict(
+            (fn, build_function_index.get_entry(fn, mat.text()))
+            for fn, (mat, _) in state.files.items()
+            if is_function(fn)
+        )
+
+    def update_function_index(self, fns):
+        for fn in filter(is_function, fns):
+            if fn in self.state.files:
+                mat = self.state.files[fn][0]
+                self.function_entries[fn] = build_function_index.get_entry(
+                    fn, mat.text()
+                )
+            else:
+                self.function_entries.pop(fn, None)
+
+        shards = build_function_index.as_shards(self.function_entries.values())
+        build_function_index.write_index(shards, function_index_abs, 1)
+
+    @staticmethod
+    def publish_fns():
+        return glob.glob(join(publish_abs, "*"))
+
+    def poll(self):
+        """returns a list of changed .rst files (relative to the source
+        directory); an empty list if nothing changed, or None if other
+        files changed and Sphinx should update all outdated pages"""
+        m_files = snapshot(get_all_fns())
+        changed_m = changed_files(self.m_files, m_files)
+        self.m_files = m_files
+
+        publish_files = snapshot(self.publish_fns())
+        changed_publish = changed_files(self.publish_files, publish_files)
+        self.publish_files = publish_files
+
+        git_head = stat_key(git_head_fn)
+        changed_git = git_head != self.git_head
+        self.git_head = git_head
+
+        # a new or updated published page requires the page with the
+        # link to it to be rendered again
+        for fn in changed_publish:
+            if fn.endswith(".html"):
+                stem = basename(fn)[: -len(".html")]
+                changed_m.extend(
+                    m_fn for m_fn in m_files if basename(m_fn)[:-2] == stem
+                )
+
+        changed_rst = self.state.update(sorted(set(changed_m)))
+
+        if any(is_function(fn) for fn in changed_m):
+            self.update_function_index(changed_m)
+
+        if any(not fn.endswith(".html") for fn in changed_publish):
+            run_tool("build_demo_images.py")
+            changed_rst = None
+
+        if changed_git:
+            run_tool("summarize_git_log.py")
+            changed_rst = None
+
+        return changed_rst
+
+    def build(self, changed_rst):
+        start_time = time.time()
+        if changed_rst is None:
+            self.app.build(False)
+        else:
+            fns = [join(output_root_abs, fn) for fn in changed_rst]
+            self.app.build(False, [fn for fn in fns if isfile(fn)])
+
+        print(
+            "Rebuilt %s in %.2fs"
+            % (
+                "outdated pages" if changed_rst is None else ", ".join(changed_rst),
+                time.time() - start_time,
+            )
+        )
+
+    def run(self):
+        print("Watching for changes; press Ctrl-C to stop")
+        while True:
+            time.sleep(self.interval)
+            changed_rst = self.poll()
+            if changed_rst is None or changed_rst:
+                self.build(changed_rst)
+
+
+def is_function(fn):
+    """True if fn is in the function index"""
+    in_matlab_dir = os.path.dirname(fn) == matlab2rst.matlab_dir
+    return in_matlab_dir and basename(fn).startswith(function_prefix)
+
+
+def run_tool(name):
+    subprocess.call([sys.executable, join("tools", name)], cwd=doc_root_dir)
+
+
+def get_sphinx_app(builder, build_dir):
+    from sphinx.application import Sphinx
+
+    return Sphinx(
+        output_root_abs,
+        output_root_abs,
+        join(build_dir, builder),
+        join(build_dir, "doctrees"),
+        builder,
+        status=sys.stdout,
+        warning=sys.stderr,
+    )
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="rebuild the documentation incrementally when .m files change"
+    )
+    parser.add_argument("-b", "--builder", default="html", help="Sphinx builder")
+    parser.add_argument(
+        "--build_dir", default=join(doc_root_dir, "build"), help="output directory"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.2, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--page_size",
+        type=int,
+        default=full_listing_page_size,
+        help="maximum number of full listings (of demos) per page",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+    os.chdir(doc_root_dir)
+
+    # bring all generated files up to date before loading Sphinx
+    for name in (
+        "build_demo_images.py",
+        "summarize_git_log.py",
+        "build_function_index.py",
+    ):
+        run_tool(name)
+    matlab2rst.main(page_size=args.page_size)
+
+    state = MatlabState(args.page_size)
+    for fn in get_all_fns():
+        state.read(fn)
+
+    app = get_sphinx_app(args.builder, args.build_dir)
+    app.build(False)
+
+    # set up the lexer now (which takes a while), rather than after the
+    # first change
+    if hasattr(app.builder, "highlighter"):
+        app.builder.highlighter.get_lexer("", "matlab")
+
+    # updating the search index takes about half of the time of a rebuild;
+    # it is up to date after the initial build, but not after changes
+    app.builder.search = False
+
+    try:
+        Watcher(app, state, args.interval).run()
+    except KeyboardInterrupt:
+        print()
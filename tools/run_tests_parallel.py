@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# runs the unit tests in tests/test_*.m using several headless GNU Octave
+# (or Matlab) workers in parallel.
+#
+# The test files are divided over the workers using longest-processing-
+# time-first balancing, based on the durations recorded by timing_store.py
+# in previous runs (or on the file size for tests never timed). Each
+# worker runs cosmo_run_tests on its test files one by one, and reports
+# for each file a line
+#
+#   @@cosmo_test <file> <passed|failed|error> <seconds>
+#
+# and for each test skipped through cosmo_notify_test_skipped a line
+#
+#   @@cosmo_skip <file> <reason>
+#
+# These are merged into one report. To try this without Octave, use
+# '--interpreter stand-in', which reports every test as passed.
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import shlex
+import shutil
+import argparse
+import tempfile
+import subprocess
+from os.path import join, abspath, dirname, basename
+
+from timing_store import TimingStore, default_store_fn
+
+root_dir = abspath(join(dirname(__file__), ".."))
+mvpa_dir = join(root_dir, "mvpa")
+test_dir = join(root_dir, "tests")
+
+default_interpreter = "octave --no-gui --quiet --eval"
+stand_in = "stand-in"
+
+result_marker = "@@cosmo_test"
+skip_marker = "@@cosmo_skip"
+
+worker_code_template = """
+cd('%(mvpa_dir)s');
+cosmo_set_path();
+cd('%(test_dir)s');
+test_files={%(test_files)s};
+for k=1:numel(test_files)
+    test_file=test_files{k};
+    cosmo_notify_test_skipped('on');
+    t_start=clock();
+    try
+        if cosmo_run_tests(test_file,'-no_doc_test')
+            status='passed';
+        else
+            status='failed';
+        end
+    catch
+        status='error';
+        disp(lasterr());
+    end
+    fprintf('%(result_marker)s %%s %%s %%.3f\\n',test_file,status,...
+                etime(clock(),t_start));
+    skipped=cosmo_notify_test_skipped();
+    for j=1:numel(skipped)
+        fprintf('%(skip_marker)s %%s %%s\\n',test_file,...
+                    strrep(skipped{j},sprintf('\\n'),' '));
+    end
+end
+exit(0);
+"""
+
+
+class TestResult(object):
+    def __init__(self, name, status, seconds, worker=None):
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+        self.worker = worker
+        self.skipped = []
+
+    def __str__(self):
+        return "%s(%s,%s,%.1fs)" % (
+            self.__class__.__name__,
+            self.name,
+            self.status,
+            self.seconds,
+        )
+
+    @property
+    def is_failure(self):
+        return self.status != "passed"
+
+    def as_dict(self):
+        return dict(
+            name=self.name,
+            status=self.status,
+            seconds=self.seconds,
+            worker=self.worker,
+            skipped=self.skipped,
+        )
+
+
+def get_test_files(test_dir=test_dir):
+    return sorted(
+        fn
+        for fn in os.listdir(test_dir)
+        if fn.startswith("test_") and fn.endswith(".m")
+    )
+
+
+def lpt_shards(weights, count):
+    """divide the keys of weights over count shards, assigning the largest
+    remaining item to the least loaded shard. Returns a list with, for
+    each shard, a tuple (total_weight, names)"""
+    shards = [(0, i, []) for i in range(count)]
+    heapq.heapify(shards)
+
+    for name in sorted(weights, key=lambda x: (-weights[x], x)):
+        load, i, names = heapq.heappop(shards)
+        names.append(name)
+        heapq.heappush(shards, (load + weights[name], i, names))
+
+    return [(load, names) for load, _, names in sorted(shards, key=lambda s: s[1])]
+
+
+def get_worker_code(test_files):
+    quote = lambda s: "'%s'" % s.replace("'", "''")
+    return worker_code_template % dict(
+        mvpa_dir=mvpa_dir,
+        test_dir=test_dir,
+        test_files=",".join(quote(fn) for fn in test_files),
+        result_marker=result_marker,
+        skip_marker=skip_marker,
+    )
+
+
+def get_worker_command(interpreter, test_files):
+    if interpreter == stand_in:
+        prefix = [sys.executable, abspath(__file__), "--run_stand_in"]
+    else:
+        prefix = shlex.split(interpreter)
+
+    return prefix + [get_worker_code(test_files)]
+
+
+def run_stand_in(code):
+    """pretends to be the interpreter: reports all tests as passed"""
+    test_files = re.findall(r"'(test_[^']*\.m)'", code)
+    for test_file in test_files:
+        print("%s %s passed 0.000" % (result_marker, test_file))
+
+
+def parse_worker_output(lines, worker):
+    results = dict()
+    for line in lines:
+        parts = line.strip().split(" ", 3)
+        if parts[0] == result_marker and len(parts) == 4:
+            _, name, status, seconds = parts
+            results[name] = TestResult(name, status, float(seconds), worker)
+        elif parts[0] == skip_marker and len(parts) >= 3:
+            name = parts[1]
+            if name in results:
+                results[name].skipped.append(" ".join(parts[2:]))
+
+    return results
+
+
+class Worker(object):
+    def __init__(self, index, test_files, interpreter, log_dir):
+        self.index = index
+        self.test_files = test_files
+        self.interpreter = interpreter
+        self.log_fn = join(log_dir, "worker_%d.log" % index)
+        self.tmp_dir = join(log_dir, "tmp_%d" % index)
+        self.process = None
+        self.start_time = None
+        self.seconds = None
+
+    def start(self):
+        # the log directory may have been used by an earlier run
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        env = dict(os.environ, TMPDIR=self.tmp_dir, TMP=self.tmp_dir)
+        cmd = get_worker_command(self.interpreter, self.test_files)
+
+        self.log_file = open(self.log_fn, "w")
+        self.start_time = time.time()
+        self.process = subprocess.Popen(
+            cmd,
+            cwd=test_dir,
+            env=env,
+            stdout=self.log_file,
+            stderr=subprocess.STDOUT,
+        )
+
+    def wait(self):
+        returncode = self.process.wait()
+        self.seconds = time.time() - self.start_time
+        self.log_file.close()
+        return returncode
+
+    def results(self):
+        with open(self.log_fn) as f:
+            results = parse_worker_output(f, self.index)
+
+        # tests without a result line were not run (e.g. the worker crashed)
+        for name in self.test_files:
+            if name not in results:
+                results[name] = TestResult(name, "error", 0.0, self.index)
+
+        return [results[name] for name in self.test_files]
+
+    def as_dict(self):
+        return dict(
+            index=self.index,
+            tests=self.test_files,
+            seconds=self.seconds,
+            returncode=self.process.returncode,
+            log=self.log_fn,
+        )
+
+
+def run_workers(shards, interpreter, log_dir):
+    workers = [
+        Worker(i, names, interpreter, log_dir)
+        for i, (_, names) in enumerate(shards)
+        if len(names)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.wait()
+
+    return workers
+
+
+def summarize(results):
+    count = lambda status: sum(r.status == status for r in results)
+    return dict(
+        total=len(results),
+        passed=count("passed"),
+        failed=count("failed"),
+        error=count("error"),
+        skipped=sum(len(r.skipped) for r in results),
+    )
+
+
+def as_text(results, workers, summary):
+    lines = []
+    for worker in workers:
+        lines.append(
+            "worker %d: %d tests, %.1fs, exit code %s"
+            % (
+                worker.index,
+                len(worker.test_files),
+                worker.seconds,
+                worker.process.returncode,
+            )
+        )
+
+    for result in results:
+        if result.is_failure:
+            lines.append(
+                "%-7s %s (worker %d)"
+                % (result.status.upper(), result.name, result.worker)
+            )
+        for reason in result.skipped:
+            lines.append("SKIPPED %s: %s" % (result.name, reason))
+
+    lines.append(
+        "%(total)d tests: %(passed)d passed, %(failed)d failed, "
+        "%(error)d errors, %(skipped)d skipped" % summary
+    )
+    return "\n".join(lines)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(
+        description="run unit tests with parallel GNU Octave workers"
+    )
+    parser.add_argument(
+        "test_files",
+        nargs="*",
+        help="test files to run (default: all tests/test_*.m)",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="number of workers")
+    parser.add_argument(
+        "--interpreter",
+        default=default_interpreter,
+        help="command that evaluates Matlab code given as its last "
+        "argument, or '%s' to test without Octave" % stand_in,
+    )
+    parser.add_argument("--report", help="JSON output file with results")
+    parser.add_argument(
+        "--log_dir", help="directory for worker logs (default: temporary)"
+    )
+    parser.add_argument(
+        "--timings",
+        default=default_store_fn,
+        help="file with test durations, used for balancing and updated "
+        "after every run",
+    )
+    parser.add_argument(
+        "--no_record",
+        action="store_true",
+        help="do not add the durations of this run to the timings file",
+    )
+    parser.add_argument("--run_stand_in", help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    if args.run_stand_in is not None:
+        run_stand_in(args.run_stand_in)
+        sys.exit(0)
+
+    test_files = [basename(fn) for fn in args.test_files] or get_test_files()
+    store = TimingStore(args.timings)
+    weights = store.estimates(test_files, test_dir)
+    shards = lpt_shards(weights, max(1, args.jobs))
+
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="cosmo_tests_")
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+    print(
+        "Running %d tests using %d workers, expected duration %.0fs"
+        % (len(test_files), len(shards), max(load for load, _ in shards))
+    )
+    workers = run_workers(shards, args.interpreter, log_dir)
+
+    results = sum([worker.results() for worker in workers], [])
+    results.sort(key=lambda r: r.name)
+    summary = summarize(results)
+
+    print(as_text(results, workers, summary))
+
+    # durations reported by the stand-in are meaningless
+    if not (args.no_record or args.interpreter == stand_in):
+        store.append([(r.name, r.status, r.seconds) for r in results])
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(
+                dict(
+                    summary=summary,
+                    tests=[r.as_dict() for r in results],
+                    workers=[w.as_dict() for w in workers],
+                ),
+                f,
+                indent=2,
+            )
+
+    if args.log_dir is None:
+        shutil.rmtree(log_dir)
+
+    success = summary["failed"] + summary["error"] == 0
+    sys.exit(0 if success else 1)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+#   For CoSMoMVPA's license terms and conditions, see   #
+#   the COPYING file distributed with CoSMoMVPA         #
+#
+# keeps track of how long each tests/test_*.m file takes to run.
+#
+# Durations are appended to a local JSON-lines file after every run of
+# run_tests_parallel.py, and summarized per test as rolling statistics
+# (median, 95th percentile, last seen commit) over the most recent runs.
+# Tests that were never timed get an estimate based on their file size.
+#
+# Usage: timing_store.py [--slowest N] [--regressions]
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from os.path import join, abspath, dirname, getsize, isfile
+
+root_dir = abspath(join(dirname(__file__), ".."))
+default_store_fn = os.getenv(
+    "COSMO_TEST_TIMINGS", join(root_dir, ".cosmo_test_timings.jsonl")
+)
+
+# used for tests without timings when there are no timings at all
+default_seconds_per_byte = 0.001
+
+
+def percentile(sorted_values, p):
+    """nearest-rank percentile of a sorted non-empty list"""
+    index = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def get_commit():
+    try:
+        cmd = ["git", "rev-parse", "--short", "HEAD"]
+        output = subprocess.check_output(cmd, cwd=root_dir, stderr=subprocess.PIPE)
+        return output.decode("UTF-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class TimingStats(object):
+    def __init__(self, name, durations, last_commit):
+        self.name = name
+        self.durations = durations
+        self.last_commit = last_commit
+
+        s = sorted(durations)
+        self.count = len(s)
+        self.median = percentile(s, 50)
+        self.p95 = percentile(s, 95)
+        self.last = durations[-1]
+
+    def __str__(self):
+        return "%-45s %8.2fs %8.2fs %8.2fs %4d %s" % (
+            self.name,
+            self.median,
+            self.p95,
+            self.last,
+            self.count,
+            self.last_commit or "",
+        )
+
+    @staticmethod
+    def header():
+        return "%-45s %9s %9s %9s %4s %s" % (
+            "test",
+            "median",
+            "p95",
+            "last",
+            "n",
+            "commit",
+        )
+
+    def is_regression(self, factor, min_seconds):
+        """True if the last run took much longer than the runs before"""
+        previous = sorted(self.durations[:-1])
+        if not previous or self.last < min_seconds:
+            return False
+
+        return self.last > factor * percentile(previous, 50)
+
+
+class TimingStore(object):
+    def __init__(self, fn=default_store_fn, window=20):
+        self.fn = fn
+        self.window = window
+        self.records = []
+
+        if isfile(fn):
+            with open(fn) as f:
+                self.records = [json.loads(line) for line in f if line.strip()]
+
+    def append(self, results, commit=None):
+        """add results, a list of (name, status, seconds) tuples; tests that
+        did not run to completion are not recorded"""
+        if commit is None:
+            commit = get_commit()
+
+        now = int(time.time())
+        new_records = [
+            dict(test=name, status=status, seconds=seconds, commit=commit, time=now)
+            for name, status, seconds in results
+            if status in ("passed", "failed")
+        ]
+
+        with open(self.fn, "a") as f:
+            for record in new_records:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+
+        self.records.extend(new_records)
+
+        # prevent the file from growing without bounds
+        if len(self.records) > 2 * self.window * max(1, len(self.stats())):
+            self.compact()
+
+    def compact(self):
+        """keep only the most recent records of each test"""
+        counts = dict()
+        kept = []
+        for record in reversed(self.records):
+            name = record["test"]
+            counts[name] = counts.get(name, 0) + 1
+            if counts[name] <= self.window:
+                kept.append(record)
+
+        self.records = kept[::-1]
+
+        tmp_fn = self.fn + ".tmp"
+        with open(tmp_fn, "w") as f:
+            for record in self.records:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+        os.replace(tmp_fn, self.fn)
+
+    def stats(self):
+        """returns a dict mapping each test to its TimingStats"""
+        name2records = dict()
+        for record in self.records:
+            name2records.setdefault(record["test"], []).append(record)
+
+        name2stats = dict()
+        for name, records in name2records.items():
+            records = records[-self.window :]
+            durations = [r["seconds"] for r in records]
+            name2stats[name] = TimingStats(name, durations, records[-1]["commit"])
+
+        return name2stats
+
+    def seconds_per_byte(self, test_dir):
+        """ratio of median duration and file size over all timed tests"""
+        total_seconds = 0.0
+        total_bytes = 0
+        for name, stats in self.stats().items():
+            fn = join(test_dir, name)
+            if isfile(fn):
+                total_seconds += stats.median
+                total_bytes += getsize(fn)
+
+        if total_bytes == 0:
+            return default_seconds_per_byte
+
+        return total_seconds / total_bytes
+
+    def estimates(self, names, test_dir):
+        """returns a dict with the expected duration of each test"""
+        name2stats = self.stats()
+        seconds_per_byte = None
+
+        estimates = dict()
+        for name in names:
+            if name in name2stats:
+                estimates[name] = name2stats[name].median
+            else:
+                if seconds_per_byte is None:
+                    seconds_per_byte = self.seconds_per_byte(test_dir)
+                estimates[name] = getsize(join(test_dir, name)) * seconds_per_byte
+
+        return estimates
+
+    def slowest(self, count):
+        all_stats = sorted(self.stats().values(), key=lambda s: -s.median)
+        return all_stats[:count]
+
+    def regressions(self, factor=1.5, min_seconds=1.0):
+        return [
+            s
+            for s in sorted(self.stats().values(), key=lambda s: s.name)
+            if s.is_regression(factor, min_seconds)
+        ]
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="report unit test durations")
+    parser.add_argument("--store", default=default_store_fn)
+    parser.add_argument(
+        "--slowest", type=int, default=10, help="number of slowest tests to show"
+    )
+    parser.add_argument(
+        "--regressions",
+        action="store_true",
+        help="show tests whose last run was slower than usual",
+    )
+    parser.add_argument(
+        "--factor",
+        type=float,
+        default=1.5,
+        help="slowdown relative to the median that counts as regression",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    parser = get_argument_parser()
+    args = parser.parse_args()
+
+    store = TimingStore(args.store)
+    if not store.records:
+        print("No timings in %s" % args.store)
+        sys.exit(0)
+
+    print("Slowest tests:")
+    print(TimingStats.header())
+    for stats in store.slowest(args.slowest):
+        print(stats)
+
+    if args.regressions:
+        regressions = store.regressions(factor=args.factor)
+        print()
+        print("Regressions (last run > %.1f x median):" % args.factor)
+        for stats in regressions:
+            print(stats)
+
+        if regressions:
+            sys.exit(1)
@@ -32,25 +32,182 @@
 #    IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 #    CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+
 import os
 import json
 import time
+import zlib
+import socket
+import calendar
 import logging
 import argparse
+import tempfile
 
 try:
-    import urllib.request as urllib2
+    import fcntl
 except ImportError:
-    import urllib2
+    # not available on Windows; status files are still replaced atomically
+    fcntl = None
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urlsplit
+
+
+def format_timestamp(t):
+    """convert seconds since epoch to a '2016-05-10T10:00:00Z' timestamp"""
+    if t is None:
+        return None
+
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+def parse_timestamp(s):
+    """convert a '2016-05-10T10:00:00Z' timestamp to seconds since epoch"""
+    if s is None:
+        return None
+
+    # ignore fractional seconds and assume UTC
+    return calendar.timegm(time.strptime(s[:19], "%Y-%m-%dT%H:%M:%S"))
+
+
+class RequestError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """keeps one persistent (keep-alive) connection per host, so that
+    polling the CI API does not need a new TCP/TLS handshake every time"""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.connections = dict()
+        self.request_count = 0
+        self.connect_count = 0
+
+    def get_connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self.connections:
+            if scheme == "https":
+                conn_class = httplib.HTTPSConnection
+            else:
+                conn_class = httplib.HTTPConnection
+
+            self.connections[key] = conn_class(netloc, timeout=self.timeout)
+            self.connect_count += 1
+
+        return self.connections[key]
+
+    def drop_connection(self, scheme, netloc):
+        conn = self.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        all_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        if headers is not None:
+            all_headers.update(headers)
+
+        if isinstance(body, dict):
+            body = json.dumps(body).encode("utf-8")
+
+        # a keep-alive connection may have been closed by the server
+        # since the previous request, in which case it is reopened once
+        for attempt in range(2):
+            conn = self.get_connection(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, path, body, all_headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                self.drop_connection(parts.scheme, parts.netloc)
+                if attempt > 0:
+                    raise
+
+        self.request_count += 1
+
+        if response.getheader("Content-Encoding") == "gzip":
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+        if response.status >= 400:
+            raise RequestError(
+                "%s %s: %s %s" % (method, url, response.status, response.reason)
+            )
+
+        return data
+
+    def get_json(self, url, body=None, headers=None, method=None):
+        if method is None:
+            method = "GET" if body is None else "POST"
+
+        data = self.request(method, url, body, headers)
+        if not data:
+            return None
+
+        return json.loads(data.decode("utf-8"))
+
+    def close(self):
+        for key in list(self.connections):
+            self.drop_connection(*key)
+
+    def __str__(self):
+        return "%s(requests=%d,connections=%d)" % (
+            self.__class__.__name__,
+            self.request_count,
+            self.connect_count,
+        )
 
 
 class JobStatus(object):
-    def __init__(self, number, is_finished, result, allow_failure, is_leader):
+    # maps attributes to the field names in the Travis v2 'matrix' JSON
+    travis_fields = dict(
+        number="number",
+        result="result",
+        allow_failure="allow_failure",
+        job_id="id",
+        started_at="started_at",
+        finished_at="finished_at",
+    )
+
+    __slots__ = (
+        "number",
+        "is_finished",
+        "result",
+        "allow_failure",
+        "is_leader",
+        "job_id",
+        "started_at",
+        "finished_at",
+    )
+
+    def __init__(
+        self,
+        number,
+        is_finished,
+        result,
+        allow_failure,
+        is_leader,
+        job_id=None,
+        started_at=None,
+        finished_at=None,
+    ):
         self.is_finished = is_finished
         self.result = result
         self.number = number
         self.allow_failure = allow_failure
         self.is_leader = is_leader
+        self.job_id = job_id
+        self.started_at = started_at
+        self.finished_at = finished_at
 
     def __str__(self):
         return "%s(%s,N=%s,N=%s,A=%s,L=%s)" % (
@@ -73,30 +230,73 @@ class JobStatus(object):
 
         return self.result != 0
 
-    @classmethod
-    def from_matrix(cls, json_elem, leader_job_number):
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+
+        return self.finished_at - self.started_at
+
+    @staticmethod
+    def parse_result(result):
+        """convert result to 0 (success), None (unknown) or 1 (failure).
+        Strings such as 'success' or 'failure' are supported for CI
+        systems that do not use exit codes"""
+        if result is None or result == "":
+            return None
+
+        if result in (0, "0", "success", "passed"):
+            return 0
 
-        number = json_elem["number"]
-        is_finished = json_elem["finished_at"] is not None
-        result = json_elem["result"]
-        allow_failure = json_elem["allow_failure"]
-        is_leader = number == leader_job_number
+        return 1
+
+    @classmethod
+    def from_fields(cls, json_elem, leader_job_number, fields):
+        get = lambda name: json_elem.get(fields[name])
+
+        number = get("number")
+        is_finished = get("finished_at") is not None
+        result = cls.parse_result(get("result"))
+        allow_failure = bool(get("allow_failure"))
+        is_leader = "%s" % number == "%s" % leader_job_number
+        job_id = get("job_id")
+        started_at = parse_timestamp(get("started_at"))
+        finished_at = parse_timestamp(get("finished_at"))
 
         # log.info('Parsing %s: %s' % (number, json_elem))
 
-        return cls(number, is_finished, result, allow_failure, is_leader)
+        return cls(
+            number,
+            is_finished,
+            result,
+            allow_failure,
+            is_leader,
+            job_id=job_id,
+            started_at=started_at,
+            finished_at=finished_at,
+        )
+
+    @classmethod
+    def from_matrix(cls, json_elem, leader_job_number):
+        return cls.from_fields(json_elem, leader_job_number, cls.travis_fields)
 
 
 class MatrixList(list):
     @classmethod
-    def from_json(cls, raw_json, leader_job_number):
-        matrix_elems = raw_json["matrix"]
+    def from_json(cls, raw_json, leader_job_number, jobs_field="matrix", fields=None):
+        if fields is None:
+            fields = JobStatus.travis_fields
+
+        if jobs_field:
+            matrix_elems = raw_json[jobs_field]
+        else:
+            matrix_elems = raw_json
 
         list_instance = cls()
         for matrix_elem in matrix_elems:
             # log.info('converting from: %s' % matrix_elem)
 
-            job_status = JobStatus.from_matrix(matrix_elem, leader_job_number)
+            job_status = JobStatus.from_fields(matrix_elem, leader_job_number, fields)
             # log.info('status: %s' % job_status)
 
             list_instance.append(job_status)
@@ -112,22 +312,6 @@ class MatrixList(list):
             elem_str,
         )
 
-    @classmethod
-    def snapshot(cls, travis_entry, travis_token, leader_job_number):
-        log.info("Taking snapshot")
-        headers = {"content-type": "application/json"}
-        if travis_token is None:
-            log.info("No travis token")
-        else:
-            headers["Authorization"] = "token {}".format(travis_token)
-
-        suffix = "builds/%s" % build_id
-        data = None
-
-        raw_json = travis_get_json(travis_entry, suffix, data, headers)
-
-        return cls.from_json(raw_json, leader_job_number)
-
     @property
     def needs_waiting(self):
         return any(job.needs_waiting for job in self)
@@ -136,71 +320,414 @@ class MatrixList(list):
     def is_failure(self):
         return any(job.is_failure for job in self)
 
+    @property
+    def is_finished(self):
+        return all(job.is_finished or job.is_leader for job in self)
+
+    @property
+    def unfinished(self):
+        return [job for job in self if not (job.is_finished or job.is_leader)]
+
+    def estimated_time_saved(self, now):
+        """estimate how many seconds the unfinished jobs would still take,
+        based on the median duration of the finished jobs"""
+        durations = sorted(job.duration for job in self if job.duration is not None)
+        if not durations:
+            return 0
+
+        median_duration = durations[len(durations) // 2]
+
+        time_saved = 0
+        for job in self.unfinished:
+            if job.started_at is None:
+                remaining = median_duration
+            else:
+                remaining = median_duration - (now - job.started_at)
+
+            time_saved = max(time_saved, remaining)
+
+        return int(time_saved)
+
     @property
     def status(self):
-        if self.needs_waiting:
+        # a failure is final, even if other jobs are still busy (which
+        # can only be the case when failing fast)
+        if self.is_failure:
+            s = "others_failed"
+        elif self.needs_waiting:
             s = "others_busy"
         else:
-            if self.is_failure:
-                s = "others_failed"
-            else:
-                s = "others_succeeded"
+            s = "others_succeeded"
 
         return s
 
 
-def wait_others_to_finish(travis_entry, travis_token, leader_job_number):
+class JobProvider(object):
+    """base class for CI systems that report the status of all jobs in
+    a build"""
+
+    name = None
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def authenticate(self):
+        pass
+
+    def snapshot(self, leader_job_number):
+        """returns a MatrixList with the current status of all jobs"""
+        raise NotImplementedError
+
+    def cancel(self, job):
+        """cancel a job, returns True if it was cancelled"""
+        return False
+
+    def wait(self, timeout):
+        """wait before taking the next snapshot"""
+        time.sleep(timeout)
+
+    def close(self):
+        log.info("Connection pool: %s" % self.pool)
+        self.pool.close()
+
+
+class TravisProvider(JobProvider):
+    name = "travis"
+
+    def __init__(self, pool, travis_entry, build_id, gh_token=None):
+        super(TravisProvider, self).__init__(pool)
+        self.travis_entry = travis_entry
+        self.build_id = build_id
+        self.gh_token = gh_token
+        self.travis_token = None
+
+    def url(self, suffix):
+        return "%s/%s" % (self.travis_entry, suffix.lstrip("/"))
+
+    def headers(self):
+        headers = {"content-type": "application/json", "User-Agent": "Travis/1.0"}
+        if self.travis_token is None:
+            log.info("No travis token")
+        else:
+            headers["Authorization"] = "token {}".format(self.travis_token)
+
+        return headers
+
+    def authenticate(self):
+        self.travis_token = get_travis_token(self, self.gh_token)
+
+    def snapshot(self, leader_job_number):
+        log.info("Taking snapshot")
+        url = self.url("builds/%s" % self.build_id)
+        raw_json = self.pool.get_json(url, headers=self.headers())
+
+        return MatrixList.from_json(raw_json, leader_job_number)
+
+    def cancel(self, job):
+        if job.job_id is None:
+            log.info("Cannot cancel %s: no job id" % job)
+            return False
+
+        url = self.url("jobs/%s/cancel" % job.job_id)
+        self.pool.request("POST", url, b"", self.headers())
+        return True
+
+
+class GenericProvider(JobProvider):
+    """jobs API of another CI system, which must return a JSON list of
+    jobs (or a JSON object with such a list in jobs_field). Field names
+    that differ from those used by Travis are set through fields"""
+
+    name = "generic"
+
+    def __init__(
+        self,
+        pool,
+        jobs_url,
+        jobs_field=None,
+        fields=None,
+        headers=None,
+        cancel_url=None,
+    ):
+        super(GenericProvider, self).__init__(pool)
+        self.jobs_url = jobs_url
+        self.jobs_field = jobs_field
+        self.fields = dict(JobStatus.travis_fields)
+        if fields is not None:
+            self.fields.update(fields)
+        self.extra_headers = headers or dict()
+        self.cancel_url = cancel_url
+
+    def headers(self):
+        headers = {"Accept": "application/json", "User-Agent": "CoSMoMVPA/1.0"}
+        headers.update(self.extra_headers)
+        return headers
+
+    def snapshot(self, leader_job_number):
+        log.info("Taking snapshot")
+        raw_json = self.pool.get_json(self.jobs_url, headers=self.headers())
+
+        return MatrixList.from_json(
+            raw_json,
+            leader_job_number,
+            jobs_field=self.jobs_field,
+            fields=self.fields,
+        )
+
+    def cancel(self, job):
+        if self.cancel_url is None or job.job_id is None:
+            log.info("Cannot cancel %s" % job)
+            return False
+
+        url = self.cancel_url.format(id=job.job_id, number=job.number)
+        self.pool.request("POST", url, b"", self.headers())
+        return True
+
+
+class LocalProvider(JobProvider):
+    """jobs running on the same machine, each reporting its status through
+    a JSON file in a shared directory. Files are written under an
+    exclusive lock and replaced atomically; the leader wakes up as soon
+    as the directory changes, rather than after the polling interval"""
+
+    name = "local"
+    lock_name = ".lock"
+    wake_up_interval = 0.05
+
+    def __init__(self, status_dir, n_jobs):
+        super(LocalProvider, self).__init__(pool=None)
+        self.status_dir = status_dir
+        self.n_jobs = n_jobs
+
+        if not os.path.isdir(status_dir):
+            os.makedirs(status_dir)
+
+    def lock(self, exclusive):
+        lock_file = open(os.path.join(self.status_dir, self.lock_name), "a")
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+        # closing the file releases the lock
+        return lock_file
+
+    def status_filename(self, number):
+        return os.path.join(self.status_dir, "%s.json" % number)
+
+    def publish(self, job):
+        """write the status of a job; a finished job keeps the start time
+        it reported earlier"""
+        fields = JobStatus.travis_fields
+        status_fn = self.status_filename(job.number)
+
+        with self.lock(exclusive=True):
+            if job.started_at is None and os.path.isfile(status_fn):
+                with open(status_fn) as f:
+                    previous = json.load(f)
+                job.started_at = parse_timestamp(previous[fields["started_at"]])
+
+            content = {
+                fields["number"]: job.number,
+                fields["result"]: job.result,
+                fields["allow_failure"]: job.allow_failure,
+                fields["job_id"]: job.job_id,
+                fields["started_at"]: format_timestamp(job.started_at),
+                fields["finished_at"]: format_timestamp(job.finished_at),
+            }
+
+            fd, tmp_fn = tempfile.mkstemp(dir=self.status_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(content, f)
+            os.replace(tmp_fn, status_fn)
+
+        log.info("Published %s" % job)
+
+    def snapshot(self, leader_job_number):
+        with self.lock(exclusive=False):
+            json_elems = []
+            for fn in sorted(os.listdir(self.status_dir)):
+                if fn.endswith(".json"):
+                    with open(os.path.join(self.status_dir, fn)) as f:
+                        json_elems.append(json.load(f))
+
+        matrix_list = MatrixList.from_json(json_elems, leader_job_number, None)
+
+        # jobs that have not reported anything yet
+        for i in range(len(matrix_list), self.n_jobs):
+            matrix_list.append(JobStatus("?", False, None, False, False))
+
+        return matrix_list
+
+    def directory_state(self):
+        return os.stat(self.status_dir).st_mtime, sorted(os.listdir(self.status_dir))
+
+    def wait(self, timeout):
+        state = self.directory_state()
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            time.sleep(self.wake_up_interval)
+            if self.directory_state() != state:
+                return
+
+    def close(self):
+        pass
+
+
+def wait_others_to_finish(provider, leader_job_number, fail_fast=False):
+    """wait until all other jobs are finished, or (if fail_fast is set)
+    until any job that is not allowed to fail has failed.
+    Returns the last snapshot taken"""
     while True:
-        matrix_list = MatrixList.snapshot(travis_entry, travis_token, leader_job_number)
-        if all(elem.is_finished or elem.is_leader for elem in matrix_list):
+        matrix_list = provider.snapshot(leader_job_number)
+        if matrix_list.is_finished:
+            break
+
+        if fail_fast and matrix_list.is_failure:
+            log.info("Leader stops waiting, a minion failed: %s" % matrix_list)
             break
 
         log.info("Leader waits for minions: %s..." % matrix_list)
-        time.sleep(polling_interval)
+        provider.wait(polling_interval)
 
+    return matrix_list
 
-def travis_get_json(travis_entry, suffix, data, headers=None):
-    if headers is None:
-        headers = {"content-type": "application/json", "User-Agent": "Travis/1.0"}
 
-    url = "%s/%s" % (travis_entry, suffix)
-    # log.info('Using URL %s' % url)
+def cancel_jobs(provider, jobs):
+    """cancel jobs, returns the number of jobs that were cancelled"""
+    count = 0
+    for job in jobs:
+        try:
+            if provider.cancel(job):
+                count += 1
+                log.info("Cancelled %s" % job)
+        except (RequestError, httplib.HTTPException, socket.error) as e:
+            log.info("Unable to cancel %s: %s" % (job, e))
 
-    req = urllib2.Request(url, data, headers)
-    # log.info('Request: %s [%s, %s]' % (req,
-    #                                   data,
-    #                                   headers))
-    response = urllib2.urlopen(req).read()
-    # log.info('response: %s' % response)
-    json_content = json.loads(response.decode("utf-8"))
+    return count
 
-    return json_content
 
-
-def get_travis_token(travis_entry, gh_token):
+def get_travis_token(provider, gh_token):
     if gh_token is None or gh_token == "":
         log.info("GITHUB_TOKEN is not set, not using travis token")
         return None
 
-    suffix = "/auth/github"
+    url = provider.url("/auth/github")
     data = {"github_token": gh_token}
     headers = {"content-type": "application/json", "User-Agent": "Travis/1.0"}
 
-    json_content = travis_get_json(travis_entry, suffix, data, headers)
+    json_content = provider.pool.get_json(url, data, headers)
     travis_token = json_content.get("access_token")
 
     return travis_token
 
 
+def get_provider(args):
+    pool = ConnectionPool()
+
+    if args.provider == "travis":
+        gh_token = os.getenv(GITHUB_TOKEN)
+        build_id = os.getenv(TRAVIS_BUILD_ID)
+        return TravisProvider(pool, args.travis_entry, build_id, gh_token)
+
+    elif args.provider == "generic":
+        if args.jobs_url is None:
+            raise ValueError("--jobs_url is required for generic provider")
+
+        fields = dict(f.split("=", 1) for f in args.field)
+        headers = dict(
+            (k.strip(), v.strip()) for k, v in (h.split(":", 1) for h in args.header)
+        )
+        return GenericProvider(
+            pool,
+            args.jobs_url,
+            jobs_field=args.jobs_field,
+            fields=fields,
+            headers=headers,
+            cancel_url=args.cancel_url,
+        )
+
+    elif args.provider == "local":
+        if args.status_dir is None or args.n_jobs is None:
+            raise ValueError(
+                "--status_dir and --n_jobs are required for local provider"
+            )
+
+        return LocalProvider(args.status_dir, args.n_jobs)
+
+    raise ValueError("Unsupported provider %s" % args.provider)
+
+
 def get_argument_parser():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--provider",
+        choices=("travis", "generic", "local"),
+        default="travis",
+        help="CI system that reports the status of the jobs",
+    )
     parser.add_argument("--travis_entry", default="https://api.travis-ci.org")
+    parser.add_argument("--jobs_url", help="generic provider: URL that lists all jobs")
+    parser.add_argument(
+        "--jobs_field",
+        help="generic provider: field with the list of jobs in the JSON",
+    )
+    parser.add_argument(
+        "--field",
+        action="append",
+        default=[],
+        metavar="ATTR=NAME",
+        help="generic provider: JSON field name for a job attribute "
+        "(one of %s)" % ", ".join(sorted(JobStatus.travis_fields)),
+    )
+    parser.add_argument(
+        "--header",
+        action="append",
+        default=[],
+        metavar="NAME:VALUE",
+        help="generic provider: extra HTTP header, e.g. for authorization",
+    )
+    parser.add_argument(
+        "--cancel_url",
+        help="generic provider: URL to cancel a job, with {id} and "
+        "{number} replaced by the job id and number",
+    )
+    parser.add_argument(
+        "--status_dir",
+        help="local provider: shared directory with job status files",
+    )
+    parser.add_argument(
+        "--n_jobs", type=int, help="local provider: total number of jobs"
+    )
+    parser.add_argument(
+        "--result",
+        type=int,
+        help="local provider: exit code of the current job; if omitted, "
+        "the job is reported as started and the script exits immediately",
+    )
+    parser.add_argument(
+        "--allow_failure",
+        action="store_true",
+        help="local provider: the current job is allowed to fail",
+    )
+    parser.add_argument(
+        "--job_number",
+        help="number of the current job (default: $%s)" % TRAVIS_JOB_NUMBER,
+    )
     parser.add_argument("--is_master", action="store_true")
     parser.add_argument("--master_number", type=int, default=0)
     parser.add_argument(
         "--poll", type=int, default=5, help="polling interval in seconds"
     )
     parser.add_argument("--export_file", default=".to_export_back")
+    parser.add_argument(
+        "--fail_fast",
+        action="store_true",
+        help="stop waiting as soon as any required job has failed",
+    )
+    parser.add_argument(
+        "--cancel",
+        action="store_true",
+        help="with --fail_fast, cancel the jobs that are still running",
+    )
     return parser
 
 
@@ -219,7 +746,7 @@ def get_job_number():
 
 
 def report(export_file, output_dict):
-    content = " ".join("%s=%s" % (k, v) for k, v in output_dict.iteritems())
+    content = " ".join("%s=%s" % (k, v) for k, v in sorted(output_dict.items()))
     log.info("variables: %s" % content)
 
     # since python is subprocess, env variables are exported back via file
@@ -227,6 +754,12 @@ def report(export_file, output_dict):
         f.write(content)
 
 
+TRAVIS_JOB_NUMBER = "TRAVIS_JOB_NUMBER"
+TRAVIS_BUILD_ID = "TRAVIS_BUILD_ID"
+POLLING_INTERVAL = "LEADER_POLLING_INTERVAL"
+GITHUB_TOKEN = "GITHUB_TOKEN"
+BUILD_AGGREGATE_STATUS = "BUILD_AGGREGATE_STATUS"
+
 if __name__ == "__main__":
     log = logging.getLogger("travis.leader")
     log.addHandler(logging.StreamHandler())
@@ -235,22 +768,45 @@ if __name__ == "__main__":
     parser = get_argument_parser()
     args = parser.parse_args()
 
-    TRAVIS_JOB_NUMBER = "TRAVIS_JOB_NUMBER"
-    TRAVIS_BUILD_ID = "TRAVIS_BUILD_ID"
-    POLLING_INTERVAL = "LEADER_POLLING_INTERVAL"
-    GITHUB_TOKEN = "GITHUB_TOKEN"
-    BUILD_AGGREGATE_STATUS = "BUILD_AGGREGATE_STATUS"
-
-    build_id = os.getenv(TRAVIS_BUILD_ID)
-    polling_interval = os.getenv(POLLING_INTERVAL) or args.poll
-    gh_token = os.getenv(GITHUB_TOKEN)
-    job_number = os.getenv(TRAVIS_JOB_NUMBER, "")
+    for field in args.field:
+        attr = field.split("=", 1)[0]
+        if "=" not in field or attr not in JobStatus.travis_fields:
+            parser.error(
+                "--field %s: expected ATTR=NAME with ATTR one of %s"
+                % (field, ", ".join(sorted(JobStatus.travis_fields)))
+            )
+
+    polling_interval = float(os.getenv(POLLING_INTERVAL) or args.poll)
+    job_number = args.job_number or os.getenv(TRAVIS_JOB_NUMBER, "")
+    if args.provider == "local" and not job_number:
+        # the job number is the name of the status file of the job
+        parser.error(
+            "--job_number (or %s) is required for local provider" % TRAVIS_JOB_NUMBER
+        )
 
     is_master = args.is_master or job_number.endswith(".%s" % args.master_number)
 
-    travis_entry = args.travis_entry
+    if args.provider == "local":
+        # every job reports its own status, including the leader
+        provider = get_provider(args)
+        now = time.time()
+        job = JobStatus(
+            job_number,
+            args.result is not None,
+            args.result,
+            args.allow_failure,
+            is_master,
+            started_at=now if args.result is None else None,
+            finished_at=None if args.result is None else now,
+        )
+        provider.publish(job)
+
+        if args.result is None:
+            # the job only reported that it started; its work (including
+            # that of the leader) still has to be done
+            exit(0)
 
-    if job_number is None or "." not in job_number:
+    if args.provider == "travis" and "." not in job_number:
         # seems even for builds with only one job, this won't get here
         log.fatal("Don't use defining leader for build without matrix")
         exit(1)
@@ -260,15 +816,39 @@ if __name__ == "__main__":
 
     # If we get here, we are the leader
     log.info("This is a leader")
-    travis_token = get_travis_token(travis_entry, gh_token)
+    if args.provider != "local":
+        provider = get_provider(args)
+    provider.authenticate()
+
+    leader_job_number = job_number
+    final_snapshot = wait_others_to_finish(
+        provider, leader_job_number, fail_fast=args.fail_fast
+    )
 
-    leader_job_number = get_job_number()
-    wait_others_to_finish(travis_entry, travis_token, leader_job_number)
+    failed_fast = not final_snapshot.is_finished
+    if failed_fast:
+        time_saved = final_snapshot.estimated_time_saved(time.time())
+
+        if args.cancel:
+            cancel_count = cancel_jobs(provider, final_snapshot.unfinished)
+        else:
+            cancel_count = 0
+    else:
+        final_snapshot = provider.snapshot(leader_job_number)
+        time_saved = 0
+        cancel_count = 0
+
+    provider.close()
 
-    final_snapshot = MatrixList.snapshot(travis_entry, travis_token, leader_job_number)
     log.info("Final Results: %s" % final_snapshot)
 
-    output_dict = dict(BUILD_LEADER="YES", BUILD_AGGREGATE_STATUS=final_snapshot.status)
+    output_dict = dict(
+        BUILD_LEADER="YES",
+        BUILD_AGGREGATE_STATUS=final_snapshot.status,
+        BUILD_AGGREGATE_FAIL_FAST="YES" if failed_fast else "NO",
+        BUILD_AGGREGATE_TIME_SAVED=time_saved,
+        BUILD_AGGREGATE_CANCELLED=cancel_count,
+    )
 
     export_file = args.export_file
     report(export_file, output_dict)